@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Сквозной бенчмарк: poll_once -> очередь -> worker_loop -> process_track ->
+Telegram, целиком и без сети.
+
+Поднимает ServiceStub (Roblox + Telegram, см. stubs.py), генерирует
+синтетические треки (synth.py), запускает bot.py подпроцессом со стабом
+вместо настоящих сервисов и отдельной БД, ждёт засева каталога, «заливает»
+пачку новых треков разом и ждёт, пока бот их все обработает (по /metrics).
+Каждый скрейп /metrics разбирается и проверяется целиком (parse_exposition):
+невалидная строка роняет сценарий, как Prometheus отбросил бы скрейп.
+
+Отчёт по сценарию: треков в минуту, время от заливки до поста (p50/p95/max),
+пиковый RSS процесса бота, трафик стаба, число 429.
+
+  python bench/e2e.py [--scenario burst|bypass|throttled|all] [--tracks 20]
+                      [--seconds 30] [--sr 44100] [--channels 2]
+                      [--tg-per-minute 6000] [--env KEY=VALUE ...] [--timeout 600]
+
+--env пробрасывает боту любые настройки, например --env QUEUE_MODE=priority
+или --env PRESCREEN=1 — так сравниваются режимы на одном сценарии.
+"""
+
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import ServiceStub  # noqa: E402
+from synth import make_ogg  # noqa: E402
+
+BOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot.py")
+CREATOR = 1
+SEED_TRACKS = 3  # уже залитые треки: бот засевает их без постинга
+
+SCENARIOS = {
+    "burst": {
+        "about": "все треки постятся (ONLY_BYPASSED=0), сервисы отвечают мгновенно",
+        "env": {"ONLY_BYPASSED": "0"},
+        "stub": {},
+        "bypass_share": 0.25,
+    },
+    "bypass": {
+        "about": "постятся только bypassed (четверть, от пары повторных нарушителей)",
+        "env": {"ONLY_BYPASSED": "1"},
+        "stub": {},
+        "bypass_share": 0.25,
+    },
+    "throttled": {
+        "about": "как burst, но задержка 50+-50 мс, 10% ответов 429, обложки дважды Pending",
+        "env": {"ONLY_BYPASSED": "0"},
+        "stub": {"latency": 0.05, "jitter": 0.05, "rate_429": 0.1, "pending_polls": 2},
+        "bypass_share": 0.25,
+    },
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+_NAME = r"[a-zA-Z_:][a-zA-Z0-9_:]*"
+_LABEL = r'[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\[\\"n])*"'
+_SAMPLE = re.compile(rf"({_NAME})(\{{(?:{_LABEL}(?:,{_LABEL})*)?\}})? (\S+)")
+_VALUE = re.compile(r"[+-]?(?:\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?|[iI]nf)|NaN|nan")
+_TYPES = {"counter", "gauge", "summary", "histogram", "untyped"}
+_SUFFIXES = {"summary": ("", "_sum", "_count"), "histogram": ("_bucket", "_sum", "_count")}
+
+
+def parse_exposition(text: str) -> dict[str, float]:
+    """Разбор и проверка Prometheus text format 0.0.4 целиком: каждая строка —
+    HELP/TYPE или сэмпл `имя{метки} число` объявленного семейства, без
+    повторов. Любая ошибка — ValueError (Prometheus отбросил бы весь скрейп).
+    Ключ результата — имя с метками, у сэмпла без меток — просто имя."""
+    if not text.endswith("\n"):
+        raise ValueError("exposition must end with a newline")
+    types: dict[str, str] = {}
+    samples: dict[str, float] = {}
+    for n, line in enumerate(text[:-1].split("\n"), 1):
+        if line.startswith("#"):
+            parts = line.split(" ", 3)
+            if len(parts) >= 3 and parts[1] == "TYPE":
+                if len(parts) != 4 or parts[3] not in _TYPES or parts[2] in types:
+                    raise ValueError(f"line {n}: bad TYPE: {line!r}")
+                types[parts[2]] = parts[3]
+            elif len(parts) >= 3 and parts[1] == "HELP" and not re.fullmatch(_NAME, parts[2]):
+                raise ValueError(f"line {n}: bad HELP: {line!r}")
+            continue
+        m = _SAMPLE.fullmatch(line)
+        if not m or not _VALUE.fullmatch(m.group(3)):
+            raise ValueError(f"line {n}: bad sample: {line!r}")
+        name, labels = m.group(1), m.group(2) or ""
+        family = next(
+            (name.removesuffix(sfx) for sfx in ("", "_sum", "_count", "_bucket")
+             if name.endswith(sfx) and name.removesuffix(sfx) in types
+             and sfx in _SUFFIXES.get(types[name.removesuffix(sfx)], ("",))),
+            None,
+        )
+        if family is None:
+            raise ValueError(f"line {n}: sample without a TYPE: {line!r}")
+        key = name + labels
+        if key in samples:
+            raise ValueError(f"line {n}: duplicate series: {key}")
+        samples[key] = float(m.group(3))
+    return samples
+
+
+def _scrape(port: int) -> dict[str, float]:
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as r:
+            text = r.read().decode()
+    except OSError:
+        return {}
+    return parse_exposition(text)
+
+
+def _peak_rss_kb(pid: int) -> int | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            m = re.search(r"^VmHWM:\s+(\d+) kB", f.read(), re.MULTILINE)
+        return int(m.group(1)) if m else None
+    except OSError:
+        return None
+
+
+def _wait(cond, timeout: float, proc: subprocess.Popen) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            return False
+        if cond():
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def run_scenario(name: str, args) -> dict:
+    sc = SCENARIOS[name]
+    n = args.tracks
+    n_bypass = max(1, round(n * sc["bypass_share"]))
+    with tempfile.TemporaryDirectory() as tmp, ServiceStub(**sc["stub"]) as stub:
+        t = time.perf_counter()
+        for k in range(SEED_TRACKS + n):
+            asset_id = 1000 + k
+            new = k >= SEED_TRACKS
+            bypass = new and (k - SEED_TRACKS) % max(1, n // n_bypass) == 0
+            ogg = make_ogg(
+                args.seconds, 3.0 if bypass else -20.0, sr=args.sr, channels=args.channels, seed=asset_id
+            )
+            artist = f"Offender {k % 2}" if bypass else f"Artist {k}"
+            stub.add_track(asset_id, ogg, f"Track {k}", artist, CREATOR, released=not new)
+        new_ids = list(range(1000 + SEED_TRACKS, 1000 + SEED_TRACKS + n))
+        gen_seconds = time.perf_counter() - t
+
+        port = _free_port()
+        env = dict(
+            os.environ,
+            **stub.env(),
+            TELEGRAM_BOT_TOKEN="bench",
+            TELEGRAM_CHANNEL_ID="@bench",
+            DB_PATH=os.path.join(tmp, "posted.db"),
+            ARTISTS_TXT=os.path.join(tmp, "artists.txt"),
+            WATCH_CREATORS=str(CREATOR),
+            CHECK_INTERVAL="0.2",
+            HEARTBEAT_SECONDS="3600",
+            METRICS_PORT=str(port),
+            THUMBNAIL_RETRY_DELAY="0.2",
+            TG_MESSAGES_PER_MINUTE=str(args.tg_per_minute),
+            TG_BURST=str(max(2, args.tg_per_minute // 60)),
+            **sc["env"],
+        )
+        for kv in args.env:
+            key, _, value = kv.partition("=")
+            env[key] = value
+        log_path = os.path.join(tmp, "bot.log")
+        with open(log_path, "w") as log_file:
+            proc = subprocess.Popen([sys.executable, BOT], env=env, stdout=log_file, stderr=subprocess.STDOUT)
+        try:
+            # Засев: первый успешный поллинг запоминает уже залитые треки без постинга
+            if not _wait(lambda: _scrape(port).get("bot_polls_total", 0) >= 1, 60, proc):
+                raise RuntimeError("bot did not complete the first poll")
+            stub.release(new_ids)
+            t_release = time.time()
+
+            def done() -> bool:
+                m = _scrape(port)
+                return m.get("bot_tracks_processed_total", 0) + m.get("bot_tracks_dropped_total", 0) >= n
+
+            finished = _wait(done, args.timeout, proc)
+            elapsed = time.time() - t_release
+            metrics = _scrape(port)
+            rss_kb = _peak_rss_kb(proc.pid)
+        except Exception:
+            with open(log_path) as f:
+                sys.stderr.write("".join(f.readlines()[-30:]))
+            raise
+        finally:
+            proc.kill()
+            proc.wait()
+
+        ttp = sorted(p["time"] - t_release for p in stub.posts if p["asset_id"] in new_ids)
+        return {
+            "scenario": name,
+            "finished": finished,
+            "tracks": n,
+            "processed": int(metrics.get("bot_tracks_processed_total", 0)),
+            "posted": len(ttp),
+            "bypassed": int(metrics.get("bot_tracks_bypassed_total", 0)),
+            "elapsed": elapsed,
+            "tracks_per_min": metrics.get("bot_tracks_processed_total", 0) / elapsed * 60,
+            "ttp": ttp,
+            "rss_mb": rss_kb / 1024 if rss_kb else float("nan"),
+            "stub_mb": stub.bytes_sent / 1024 / 1024,
+            "responses_429": stub.responses_429,
+            "gen_seconds": gen_seconds,
+        }
+
+
+def _pct(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--scenario", default="all", choices=[*SCENARIOS, "all"])
+    ap.add_argument("--tracks", type=int, default=20)
+    ap.add_argument("--seconds", type=float, default=30.0)
+    ap.add_argument("--sr", type=int, default=44100)
+    ap.add_argument("--channels", type=int, default=2)
+    ap.add_argument("--tg-per-minute", type=int, default=6000)
+    ap.add_argument("--env", action="append", default=[], metavar="KEY=VALUE")
+    ap.add_argument("--timeout", type=float, default=600.0)
+    args = ap.parse_args()
+
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    for name in names:
+        print(f"{name}: {SCENARIOS[name]['about']}")
+        r = run_scenario(name, args)
+        ttp = r["ttp"]
+        print(
+            f"  {'done' if r['finished'] else 'TIMEOUT'}: {r['processed']}/{r['tracks']} processed, "
+            f"{r['posted']} posted, {r['bypassed']} bypassed in {r['elapsed']:.1f}s "
+            f"-> {r['tracks_per_min']:.1f} tracks/min"
+        )
+        print(
+            f"  time to post: p50 {_pct(ttp, 50):.1f}s p95 {_pct(ttp, 95):.1f}s "
+            f"max {max(ttp) if ttp else float('nan'):.1f}s"
+        )
+        print(
+            f"  peak RSS {r['rss_mb']:.0f} MB, stub sent {r['stub_mb']:.1f} MB, "
+            f"429s injected {r['responses_429']} (audio generated in {r['gen_seconds']:.1f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
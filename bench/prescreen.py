@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк пре-скрина: сколько трафика и времени экономит PRESCREEN=1 и не
+теряет ли он bypass-треки.
+
+Генерирует набор синтетических треков разной громкости (в т.ч. тихие с
+громкой вставкой и пограничные), раздаёт их через локальный стаб asset
+delivery с Range и для каждого сравнивает вердикт пре-скрина с полным
+анализом. "missed" — bypass-трек, который пре-скрин отсеял бы (должно быть 0).
+
+  python bench/prescreen.py [--seconds 120] [--per-kind 3] [--burst-seconds 5]
+                            [--windows 8] [--window-kb 24] [--min-burst 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stubs import ServiceStub  # noqa: E402
+from synth import make_ogg  # noqa: E402
+
+# вид трека -> (уровень шума dBFS, уровень вставки или None); белый шум
+# стерео после K-взвешивания примерно на 5.7 LU громче своего уровня в dBFS
+KINDS = {
+    "quiet": (-30.0, None),
+    "normal": (-20.0, None),
+    "loud": (-14.0, None),
+    "borderline": (-10.0, None),
+    "bypass": (3.0, None),
+    "quiet+burst": (-30.0, 3.0),  # громкая вставка может целиком попасть между окнами
+}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--seconds", type=float, default=120.0)
+    ap.add_argument("--per-kind", type=int, default=3)
+    ap.add_argument("--burst-seconds", type=float, default=5.0)
+    ap.add_argument("--windows", type=int, default=8)
+    ap.add_argument("--window-kb", type=int, default=24)
+    ap.add_argument("--min-burst", type=float, default=5.0)
+    args = ap.parse_args()
+
+    assets, kinds = {}, {}
+    for k, (kind, (gain, burst)) in enumerate(KINDS.items()):
+        for j in range(args.per_kind):
+            asset_id = 1000 * (k + 1) + j
+            assets[asset_id] = make_ogg(
+                args.seconds, gain, burst, burst_at=0.2 + 0.3 * j, burst_seconds=args.burst_seconds, seed=asset_id
+            )
+            kinds[asset_id] = kind
+
+    with ServiceStub() as stub:
+        for asset_id, ogg in assets.items():
+            stub.add_track(asset_id, ogg, kinds[asset_id], "bench", creator=1)
+        os.environ.update(
+            TELEGRAM_BOT_TOKEN="bench", TELEGRAM_CHANNEL_ID="@bench", ASSETDELIVERY_URL=stub.url, PRESCREEN="1",
+            PRESCREEN_WINDOWS=str(args.windows), PRESCREEN_WINDOW_KB=str(args.window_kb),
+            PRESCREEN_MIN_BURST=str(args.min_burst),
+        )
+        import bot
+
+        print(f"{'asset':>6} {'kind':<12} {'fetched':>9} {'size':>9} {'~LUFS':>7} {'LUFS':>7} "
+              f"{'prescreen':>10} {'full':>9}  verdict")
+        missed = skipped = 0
+        fetched = total = 0
+        t_pre = t_full = 0.0
+        for asset_id, kind in kinds.items():
+            t = time.perf_counter()
+            ps = bot.prescreen_audio(asset_id)
+            t_pre += time.perf_counter() - t
+            t = time.perf_counter()
+            full = bot.analyze_and_encode(bot.download_audio(asset_id), ["peak", "loudness", "true_peak"])
+            t_full += time.perf_counter() - t
+            bypassed = bot.is_bypassed(full)
+            skip = ps.verdict == "skip"
+            missed += skip and bypassed
+            skipped += skip
+            fetched += ps.fetched + (0 if skip else len(assets[asset_id]))
+            total += len(assets[asset_id])
+            est = ps.estimate
+            print(
+                f"{asset_id:>6} {kind:<12} {ps.fetched / 1024:>8.0f}K {len(assets[asset_id]) / 1024:>8.0f}K "
+                f"{est.lufs if est else float('nan'):>7.1f} {full.lufs:>7.1f} {ps.verdict:>10} "
+                f"{'bypassed' if bypassed else '-':>9}  {'MISSED' if skip and bypassed else 'ok'}"
+            )
+
+    print(
+        f"\nskipped {skipped}/{len(kinds)} without full download, missed bypass: {missed}; "
+        f"traffic {fetched / 1024:.0f} KB vs {total / 1024:.0f} KB without pre-screen ({fetched / total:.0%}); "
+        f"pre-screen {t_pre:.2f}s vs full analysis {t_full:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк записей конвейера: память на N «живых» записей и скорость
+SQLite-адаптера.
+
+Сравнивает прежнее представление (dict, waveform — list[float]) с
+dataclass-записями bot.py (Track / Analysis со __slots__, waveform — float32
+ndarray). Память меряется tracemalloc: все N записей держатся в списке
+одновременно, как очередь или бэктест в памяти. У Analysis считаются поля
+сводки и waveform — loudness_profile и mp3 одинаковы в обоих вариантах
+(ndarray / bytes) и только утопили бы разницу.
+
+Скорость: N строк очереди через queue_next-подобный SELECT — кортежи +
+сборка dict против row_factory=_track_row.
+
+Заодно проверяет круговой путь save_profile -> load_profile для обеих
+кодировок субблоков (f4 и f2db).
+
+  python bench/records.py [--records 100000]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "bench")
+os.environ.setdefault("TELEGRAM_CHANNEL_ID", "@bench")
+os.environ.setdefault("DB_PATH", os.path.join(tempfile.gettempdir(), "bench-records.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+
+def _fields(k: int, rng: np.random.Generator) -> tuple:
+    # Строки разные у каждой записи — как у настоящих треков
+    return (
+        10_000_000 + k, f"Track title {k}", f"Artist {k % 5000}", f"2026-10-{1 + k % 28:02d}T12:00:00.{k:06d}Z",
+        float(rng.uniform(30, 300)), 44100, 2, float(rng.uniform(-12, 6)), float(rng.uniform(-12, 6)),
+        float(rng.uniform(-30, 0)), rng.random(bot.WAVEFORM_BUCKETS),
+    )
+
+
+def as_dicts(k: int, rng) -> tuple[dict, dict]:
+    i, name, artist, created, dur, sr, ch, peak, tp, lufs, wf = _fields(k, rng)
+    item = {"id": i, "name": name, "artist": artist, "created_utc": created}
+    analysis = {
+        "duration": dur, "sample_rate": sr, "channels": ch, "peak_db": peak, "true_peak_db": tp,
+        "lufs": lufs, "waveform": wf.tolist(), "is_stereo": True, "stereo_kind": "stereo",
+        "side_mid_db": -20.0, "stage_times": {},
+    }
+    return item, analysis
+
+
+def as_records(k: int, rng) -> tuple[bot.Track, bot.Analysis]:
+    i, name, artist, created, dur, sr, ch, peak, tp, lufs, wf = _fields(k, rng)
+    item = bot.Track(i, name, artist, created)
+    analysis = bot.Analysis(
+        dur, sr, ch, peak_db=peak, true_peak_db=tp, lufs=lufs, waveform=wf.astype(np.float32),
+        is_stereo=True, stereo_kind="stereo", side_mid_db=-20.0,
+    )
+    return item, analysis
+
+
+def measure(make, n: int) -> tuple[float, float]:
+    """Байт на запись (элемент очереди, анализ) при n записях в памяти."""
+    rng = np.random.default_rng(0)
+    tracemalloc.start()
+    items, analyses = [], []
+    for k in range(n):
+        item, analysis = make(k, rng)
+        items.append(item)
+        analyses.append(analysis)
+    both = tracemalloc.get_traced_memory()[0]
+    del analyses
+    only_items = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return only_items / n, (both - only_items) / n
+
+
+def row_speed(n: int) -> tuple[float, float]:
+    """Секунды на чтение n строк очереди: dict из кортежа против _track_row."""
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE queue (asset_id INTEGER, name TEXT, artist TEXT, created_utc TEXT)")
+    conn.executemany("INSERT INTO queue VALUES (?, ?, ?, ?)", (bot.Track(k, f"t{k}", "a", "c").to_row() for k in range(n)))
+    sql = "SELECT asset_id, name, artist, created_utc FROM queue"
+
+    def read_dicts():
+        return [{"id": r[0], "name": r[1], "artist": r[2], "created_utc": r[3]} for r in conn.execute(sql)]
+
+    def read_records():
+        cur = conn.execute(sql)
+        cur.row_factory = bot._track_row
+        return cur.fetchall()
+
+    def best(read) -> float:  # лучший из 5 — без шума аллокатора на первом проходе
+        times = []
+        for _ in range(5):
+            t = time.perf_counter()
+            read()
+            times.append(time.perf_counter() - t)
+        return min(times)
+
+    t_dict, t_rec = best(read_dicts), best(read_records)
+    rows, recs = read_dicts(), read_records()
+    assert len(rows) == len(recs) == n and recs[-1].to_row() == tuple(rows[-1].values())
+    return t_dict, t_rec
+
+
+def profile_roundtrip() -> dict[str, float]:
+    """save_profile -> load_profile: поля совпадают, массивы — в пределах
+    точности кодировки. Возвращает худшую относительную ошибку субблоков."""
+    rng = np.random.default_rng(1)
+    sub = rng.uniform(1e-7, 0.5, 600)
+    wf = rng.random(bot.WAVEFORM_BUCKETS).astype(np.float32)
+    a = bot.Analysis(123.4, 44100, 2, peak_db=-0.5, true_peak_db=0.2, lufs=-9.8, loudness_profile=sub, waveform=wf)
+    errors = {}
+    conn = bot.db_connect()
+    assert bot.load_profile(conn, -1) is None
+    for asset_id, dtype in enumerate(("float32", "float16"), 1):
+        bot.PROFILE_DTYPE = dtype
+        bot.save_profile(conn, asset_id, a)
+        b = bot.load_profile(conn, asset_id)
+        assert (b.duration, b.sample_rate, b.channels, b.peak_db, b.true_peak_db, b.lufs) == (
+            a.duration, a.sample_rate, a.channels, a.peak_db, a.true_peak_db, a.lufs,
+        )
+        assert b.waveform.dtype == np.float32 and np.allclose(b.waveform, wf, atol=1e-3)
+        errors[dtype] = float(np.max(np.abs(b.loudness_profile / sub - 1)))
+        assert errors[dtype] < (1e-6 if dtype == "float32" else 0.01)
+    return errors
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--records", type=int, default=100_000)
+    args = ap.parse_args()
+    n = args.records
+
+    d_item, d_an = measure(as_dicts, n)
+    r_item, r_an = measure(as_records, n)
+    mb = n / 1024 / 1024
+    print(f"{n} records in memory (waveform {bot.WAVEFORM_BUCKETS} buckets):")
+    print(f"  queue item: dict {d_item:.0f} B -> Track {r_item:.0f} B ({d_item * mb:.1f} -> {r_item * mb:.1f} MB)")
+    print(f"  analysis:   dict {d_an:.0f} B -> Analysis {r_an:.0f} B ({d_an * mb:.1f} -> {r_an * mb:.1f} MB)")
+    t_dict, t_rec = row_speed(n)
+    print(f"  SQLite -> record: dict {t_dict * 1e9 / n:.0f} ns/row, _track_row {t_rec * 1e9 / n:.0f} ns/row")
+    errors = profile_roundtrip()
+    print("  save_profile -> load_profile: ok, subblock error " + ", ".join(f"{k} {v:.1e}" for k, v in errors.items()))
+
+
+if __name__ == "__main__":
+    main()
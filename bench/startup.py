@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк старта: сколько проходит от запуска процесса до первого поллинга.
+
+Запускает bot.py подпроцессом (во временной папке с отдельной БД) и ждёт в
+логе строку "first poll done ... after start" — она пишется, когда первый
+poll_once вернулся. Сравнивает FAST_START=1 и 0. Roblox изображает
+локальный стаб (stubs.py), а шрифты берутся из заранее заполненной папки
+(--fonts, FONTS_DOWNLOAD=0), так что сеть не нужна вовсе. Без Inter-*.ttf в
+папке бот лишь предупредит об этом — ensure_fonts при этом ничего не качает,
+как и с готовыми шрифтами, так что на время старта это не влияет.
+
+  python bench/startup.py [--runs 5] [--timeout 60] [--fonts DIR]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stubs import ServiceStub  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT = os.path.join(ROOT, "bot.py")
+FONTS = ("Inter-Regular.ttf", "Inter-SemiBold.ttf", "Inter-Bold.ttf")
+
+
+def time_to_first_poll(fast: bool, timeout: float, fonts: str) -> float | None:
+    with tempfile.TemporaryDirectory() as tmp, ServiceStub() as stub:
+        env = dict(
+            os.environ,
+            **stub.env(),
+            WATCH_CREATORS="1",
+            TELEGRAM_BOT_TOKEN="bench",
+            TELEGRAM_CHANNEL_ID="@bench",
+            FAST_START="1" if fast else "0",
+            FONTS_DIR=fonts,
+            FONTS_DOWNLOAD="0",
+            DB_PATH=os.path.join(tmp, "posted.db"),
+            ARTISTS_TXT=os.path.join(tmp, "artists.txt"),
+            LOG_LEVEL="INFO",
+        )
+        t0 = time.monotonic()
+        proc = subprocess.Popen(
+            [sys.executable, BOT], env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL, text=True
+        )
+        try:
+            for line in proc.stderr:
+                if "first poll done" in line:
+                    return time.monotonic() - t0
+                if time.monotonic() - t0 > timeout:
+                    break
+            return None
+        finally:
+            proc.kill()
+            proc.wait()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--timeout", type=float, default=60.0)
+    ap.add_argument(
+        "--fonts", default=os.environ.get("FONTS_DIR") or os.path.join(ROOT, "fonts"),
+        help="заранее заполненная папка с Inter-*.ttf (по умолчанию FONTS_DIR бота)",
+    )
+    args = ap.parse_args()
+
+    missing = [f for f in FONTS if not os.path.exists(os.path.join(args.fonts, f))]
+    if missing:
+        print(f"note: {', '.join(missing)} missing in {args.fonts} (cards would use the default font)")
+
+    for fast in (True, False):
+        results = [time_to_first_poll(fast, args.timeout, args.fonts) for _ in range(args.runs)]
+        ok = [r for r in results if r is not None]
+        label = "FAST_START=1" if fast else "FAST_START=0"
+        if not ok:
+            print(f"{label}: failed (no first poll within {args.timeout:g}s)")
+            continue
+        print(
+            f"{label}: time to first poll median {statistics.median(ok) * 1000:.0f} ms, "
+            f"min {min(ok) * 1000:.0f} ms, max {max(ok) * 1000:.0f} ms "
+            f"({len(ok)}/{len(results)} runs ok)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Локальные HTTP-стабы внешних сервисов для бенчмарков (без сети).
+
+ServiceStub на одном порту изображает всё, с чем говорит бот:
+  toolbox-service  /toolbox-service/v1/marketplace/3, /toolbox-service/v1/items/details
+  thumbnails       /v1/assets (сначала pending_polls раз Pending, потом Completed) + /img/N.png
+  asset delivery   /v1/asset?id=N -> 302 на /cdn/N, /cdn/N отдаёт файл с Range (206)
+  Telegram Bot API /bot<token>/<method> (sendPhoto / sendAudio запоминаются как посты)
+
+Настраиваются задержка ответа (latency + случайный jitter), доля 429 у
+Roblox и Telegram (rate_429, с Retry-After / retry_after) и поддержка Range.
+Треки появляются в выдаче только после release() — так сценарий отделяет
+засев каталога от новых заливок и меряет время от заливки до поста.
+
+    with ServiceStub() as stub:
+        stub.add_track(101, ogg, "Title", "Artist", creator=1)
+        os.environ.update(stub.env())  # ROBLOX_API_URL, THUMBNAILS_URL, ...
+"""
+
+import email.parser
+import io
+import json
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _cover_png() -> bytes:
+    from PIL import Image
+
+    bio = io.BytesIO()
+    Image.new("RGB", (420, 420), (40, 40, 40)).save(bio, "PNG")
+    return bio.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, как у настоящих сервисов
+    disable_nagle_algorithm = True  # заголовки и тело уходят разными write — без +40 мс на ответ
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, code: int, body: bytes = b"", headers: dict | None = None):
+        self.send_response(code)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stub.count(len(body))
+
+    def _json(self, obj, code: int = 200, headers: dict | None = None):
+        self._send(code, json.dumps(obj).encode(), {"Content-Type": "application/json", **(headers or {})})
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        stub.delay()
+
+        if url.path.startswith("/toolbox-service/"):
+            if stub.inject_429():
+                return self._send(429, b"Too many requests", {"Retry-After": "1"})
+            if url.path == "/toolbox-service/v1/marketplace/3":
+                creator = int(query.get("creatorTargetId", ["0"])[0])
+                limit = int(query.get("limit", ["50"])[0])
+                return self._json({"data": [{"id": i} for i in stub.released(creator)[:limit]]})
+            if url.path == "/toolbox-service/v1/items/details":
+                ids = [int(i) for i in query.get("assetIds", [""])[0].split(",") if i]
+                return self._json({"data": [stub.details(i) for i in ids if i in stub.tracks]})
+            return self._send(404)
+
+        if url.path == "/v1/assets":  # thumbnails
+            asset_id = int(query.get("assetIds", ["0"])[0])
+            if stub.thumbnail_pending(asset_id):
+                return self._json({"data": [{"targetId": asset_id, "state": "Pending", "imageUrl": ""}]})
+            return self._json(
+                {"data": [{"targetId": asset_id, "state": "Completed", "imageUrl": f"{stub.url}/img/{asset_id}.png"}]}
+            )
+        if re.fullmatch(r"/img/\d+\.png", url.path):
+            return self._send(200, stub.cover, {"Content-Type": "image/png"})
+
+        if url.path == "/v1/asset":  # asset delivery
+            asset_id = int(query.get("id", ["0"])[0])
+            if asset_id not in stub.tracks:
+                return self._send(404)
+            return self._send(302, headers={"Location": f"/cdn/{asset_id}"})
+        m = re.fullmatch(r"/cdn/(\d+)", url.path)
+        if not m or int(m.group(1)) not in stub.tracks:
+            return self._send(404)
+        data = stub.tracks[int(m.group(1))]["ogg"]
+        rng = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if not rng or not stub.ranges:
+            return self._send(200, data, {"Accept-Ranges": "bytes" if stub.ranges else "none"})
+        start = int(rng.group(1))
+        end = min(int(rng.group(2)) if rng.group(2) else len(data) - 1, len(data) - 1)
+        if start >= len(data):
+            return self._send(416, headers={"Content-Range": f"bytes */{len(data)}"})
+        self._send(
+            206, data[start : end + 1],
+            {"Accept-Ranges": "bytes", "Content-Range": f"bytes {start}-{end}/{len(data)}"},
+        )
+
+    def do_POST(self):
+        stub = self.server.stub
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        m = re.fullmatch(r"/bot[^/]+/(\w+)", urllib.parse.urlsplit(self.path).path)
+        if not m:
+            return self._send(404)
+        stub.delay()
+        if stub.inject_429():
+            return self._json(
+                {"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                 "parameters": {"retry_after": 1}},
+                429,
+            )
+        fields, uploaded = _parse_form(self.headers.get("Content-Type", ""), body)
+        self._json({"ok": True, "result": stub.telegram(m.group(1), fields, uploaded)})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # бенчмарк убивает бота посреди keep-alive — обрывы соединений не ошибка
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def _parse_form(content_type: str, body: bytes) -> tuple[dict, int]:
+    """Поля формы (urlencoded или multipart) и суммарный размер файлов."""
+    if content_type.startswith("multipart/form-data"):
+        msg = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        fields, uploaded = {}, 0
+        for part in msg.get_payload():
+            payload = part.get_payload(decode=True) or b""
+            if part.get_filename():
+                uploaded += len(payload)
+            fields[part.get_param("name", header="content-disposition")] = (
+                payload if part.get_filename() else payload.decode()
+            )
+        return fields, uploaded
+    return dict(urllib.parse.parse_qsl(body.decode())), 0
+
+
+class ServiceStub:
+    """Стаб Roblox + Telegram на 127.0.0.1 (порт выбирается свободный)."""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_429: float = 0.0,
+        pending_polls: int = 0,
+        ranges: bool = True,
+        seed: int = 0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.pending_polls = pending_polls
+        self.ranges = ranges
+        self.tracks: dict[int, dict] = {}
+        self.posts: list[dict] = []  # {"asset_id", "time", "uploaded"} — по одному на sendAudio
+        self.bytes_sent = 0
+        self.responses_429 = 0
+        self.cover = _cover_png()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thumb_polls: dict[int, int] = {}
+        self._messages: dict[int, int] = {}  # message_id фото -> asset_id
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.stub = self
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def env(self) -> dict[str, str]:
+        """Переменные окружения, направляющие бота в этот стаб."""
+        return {
+            "ROBLOX_API_URL": self.url,
+            "THUMBNAILS_URL": self.url,
+            "ASSETDELIVERY_URL": self.url,
+            "TELEGRAM_API_URL": self.url,
+        }
+
+    def add_track(self, asset_id: int, ogg: bytes, name: str, artist: str, creator: int, released: bool = False):
+        self.tracks[asset_id] = {
+            "ogg": ogg, "name": name, "artist": artist, "creator": creator,
+            "released": time.time() if released else None,
+        }
+
+    def release(self, asset_ids: list[int]):
+        """Треки «заливаются» — появляются в выдаче marketplace."""
+        now = time.time()
+        with self._lock:
+            for i in asset_ids:
+                self.tracks[i]["released"] = now
+
+    def released(self, creator: int) -> list[int]:
+        with self._lock:
+            ids = [i for i, t in self.tracks.items() if t["creator"] == creator and t["released"] is not None]
+        return sorted(ids, reverse=True)
+
+    def details(self, asset_id: int) -> dict:
+        t = self.tracks[asset_id]
+        created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t["released"] or time.time()))
+        return {
+            "asset": {"id": asset_id, "name": t["name"], "createdUtc": created,
+                      "audioDetails": {"title": t["name"], "artist": t["artist"]}},
+            "creator": {"name": t["artist"]},
+        }
+
+    def thumbnail_pending(self, asset_id: int) -> bool:
+        with self._lock:
+            n = self._thumb_polls[asset_id] = self._thumb_polls.get(asset_id, 0) + 1
+        return n <= self.pending_polls
+
+    def telegram(self, method: str, fields: dict, uploaded: int) -> dict | bool:
+        with self._lock:
+            message_id = len(self._messages) + len(self.posts) + 1
+            if method == "sendPhoto":
+                m = re.search(r"/asset/(\d+)", fields.get("caption", ""))
+                self._messages[message_id] = int(m.group(1)) if m else 0
+                return {"message_id": message_id, "photo": [{"file_id": f"photo{message_id}", "file_size": uploaded}]}
+            if method == "sendAudio":
+                asset_id = self._messages.get(int(fields.get("reply_to_message_id", 0)), 0)
+                self.posts.append({"asset_id": asset_id, "time": time.time(), "uploaded": uploaded})
+                return {"message_id": message_id, "audio": {"file_id": f"audio{message_id}", "file_size": uploaded}}
+        return True
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self._rng.random() * self.jitter)
+
+    def inject_429(self) -> bool:
+        with self._lock:
+            hit = self._rng.random() < self.rate_429
+            self.responses_429 += hit
+        return hit
+
+    def count(self, n: int):
+        with self._lock:
+            self.bytes_sent += n
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
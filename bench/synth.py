@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Синтетические OGG Vorbis для бенчмарков и стабов: шум с заданным уровнем,
+опционально с громкой вставкой (как у треков, которые тихие почти везде).
+
+Пишет файл кусками по секунде: один большой sf.write в OGG на высоких
+частотах дискретизации роняет libsndfile.
+
+  python bench/synth.py out.ogg [--seconds 120] [--gain-db -20] [--burst-db 0]
+                        [--burst-at 0.5] [--burst-seconds 5] [--sr 44100] [--mono]
+"""
+
+import argparse
+import io
+
+import numpy as np
+import soundfile as sf
+
+
+def make_ogg(
+    seconds: float = 120.0,
+    gain_db: float = -20.0,
+    burst_db: float | None = None,
+    burst_at: float = 0.5,
+    burst_seconds: float = 5.0,
+    sr: int = 44100,
+    channels: int = 2,
+    seed: int = 0,
+) -> bytes:
+    """OGG Vorbis с белым шумом уровня gain_db (dBFS RMS); burst_db — уровень
+    вставки длиной burst_seconds с середины на доле burst_at длины трека.
+    Уровни выше 0 dBFS жёстко клипаются в ±1 (так звучат bypass-треки)."""
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sr)
+    burst_from = int((burst_at * seconds - burst_seconds / 2) * sr)
+    burst_to = burst_from + int(burst_seconds * sr)
+    bio = io.BytesIO()
+    with sf.SoundFile(bio, "w", sr, channels, format="OGG", subtype="VORBIS") as f:
+        for start in range(0, total, sr):
+            n = min(sr, total - start)
+            gain = np.full(n, 10 ** (gain_db / 20), dtype=np.float32)
+            if burst_db is not None:
+                lo, hi = max(burst_from - start, 0), min(burst_to - start, n)
+                if lo < hi:
+                    gain[lo:hi] = 10 ** (burst_db / 20)
+            block = rng.standard_normal((n, channels)).astype(np.float32) * gain[:, None]
+            f.write(np.clip(block, -1.0, 1.0))
+    return bio.getvalue()
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("out")
+    ap.add_argument("--seconds", type=float, default=120.0)
+    ap.add_argument("--gain-db", type=float, default=-20.0)
+    ap.add_argument("--burst-db", type=float, default=None)
+    ap.add_argument("--burst-at", type=float, default=0.5)
+    ap.add_argument("--burst-seconds", type=float, default=5.0)
+    ap.add_argument("--sr", type=int, default=44100)
+    ap.add_argument("--mono", action="store_true")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    data = make_ogg(
+        args.seconds, args.gain_db, args.burst_db, args.burst_at, args.burst_seconds,
+        args.sr, 1 if args.mono else 2, args.seed,
+    )
+    with open(args.out, "wb") as f:
+        f.write(data)
+    print(f"{args.out}: {len(data) / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -16,11 +16,56 @@ DistroKid → Roblox → Telegram логгер.
   ONLY_BYPASSED       - "1" постить только bypassed (по умолчанию), "0" — все треки
   BYPASS_LUFS         - порог LUFS для bypass (по умолчанию -3)
   BYPASS_PEAK_DB      - порог пика dB для bypass (по умолчанию 4)
+  BYPASS_TRUE_PEAK    - "1" сравнивать с порогом true-peak (dBTP) вместо sample peak
+  PROFILE_DTYPE       - профили громкости в БД: float32 (по умолчанию), float16, off
+  ANALYSIS_STAGES     - этапы анализа через запятую (по умолчанию — по режиму постинга)
+  FAKE_STEREO_DB      - порог side/mid (dB), ниже которого стерео считается псевдо-стерео
+  TG_MESSAGES_PER_MINUTE - лимит сообщений в канал в минуту (по умолчанию 20)
+  TG_BURST            - сколько сообщений можно отправить подряд без ожидания (2)
+  TG_MAX_RETRIES      - повторов одного вызова Bot API на 429 / 5xx / неустановленное соединение (5)
+  CARD_FORMAT         - формат карточки: jpeg (по умолчанию), webp, png
+  CARD_QUALITY        - качество jpeg/webp (по умолчанию 90)
+  CARD_SIZE           - сторона карточки в px (по умолчанию 1080)
+  WATCH_CREATORS      - ID создателей Roblox через запятую (по умолчанию DistroKid)
+  QUEUE_MODE          - порядок очереди: fifo (по умолчанию) или priority
+  QUEUE_AGING         - очков приоритета за минуту ожидания (по умолчанию 1)
+  PRIORITY_KEYWORDS   - слова в названии, поднимающие приоритет (через запятую)
+  PRESCREEN           - "1" — пре-скрин по кусочкам файла (Range) до полного скачивания
+  PRESCREEN_WINDOW_KB - размер одного окна пре-скрина, КБ (по умолчанию 24)
+  PRESCREEN_WINDOWS   - сколько окон пре-скрина минимум (по умолчанию 8)
+  PRESCREEN_MARGIN    - запас пре-скрина до порогов, LU/dB (по умолчанию 3)
+  PRESCREEN_MIN_BURST - самая короткая громкая вставка, которую пре-скрин обязан
+                        увидеть, сек (по умолчанию 5)
+  ROBLOX_API_URL, THUMBNAILS_URL, ASSETDELIVERY_URL, TELEGRAM_API_URL
+                      - базовые URL сервисов (для бенчмарков со стабами, см. bench/)
+  THUMBNAIL_RETRY_DELAY - пауза между опросами Pending-обложки, сек (по умолчанию 3)
+  HEDGE_MODE          - опрос стратегий сбора: hedge (по умолчанию), all, off
+  HEDGE_DELAY         - через сколько секунд дублировать медленный запрос (по умолчанию — p95)
+  METRICS_PORT        - порт /metrics и /healthz на METRICS_HOST (127.0.0.1); 0 — выключено
+  HEALTH_STALL_SECONDS - через сколько секунд без шагов поллер/воркер считается зависшим
+  METRICS_JSON        - путь для JSON-дампа гистограмм латентностей (каждый heartbeat)
+  PROFILER            - сэмплирующий профайлер: collapsed (flamegraph) или pstats
+  PROFILE_OUT         - куда писать профиль (по умолчанию profile.txt / profile.pstats)
+  PROFILE_INTERVAL    - период сэмплирования стеков профайлером, сек (по умолчанию 0.005)
+  FAST_START          - "1" (по умолчанию) поллер стартует сразу, тяжёлые модули,
+                        шрифты и самодиагностика — в фоне; "0" — всё по очереди
+  DB_PATH / ARTISTS_TXT / FONTS_DIR - пути к БД, txt артистов и локальным шрифтам
+  FONTS_DOWNLOAD      - "0" — не качать шрифты, брать только готовые из FONTS_DIR
+
+Бэктест порогов по сохранённым профилям (без повторного декодирования):
+  python bot.py backtest <LUFS> <PEAK_DB>
 """
 
+from __future__ import annotations
+
+import functools
 import gzip
+import hashlib
+import importlib
 import io
+import json
 import logging
+import marshal
 import math
 import os
 import sqlite3
@@ -28,17 +73,47 @@ import sys
 import threading
 import time
 import urllib.parse
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass, field, fields
 
-import lameenc
-import numpy as np
 import requests
-import soundfile as sf
-from PIL import Image, ImageDraw, ImageFont, ImageOps
 from requests.adapters import HTTPAdapter
-from scipy.signal import lfilter, resample_poly
+from urllib3.exceptions import NewConnectionError
+
+
+class _LazyModule:
+    """Прокси модуля: настоящий импорт — при первом обращении к атрибуту,
+    после чего прокси подменяет себя в globals() настоящим модулем (дальше
+    никаких накладных расходов)."""
+
+    def __init__(self, name: str, alias: str):
+        self._name = name
+        self._alias = alias
+
+    def load(self):
+        mod = importlib.import_module(self._name)
+        globals()[self._alias] = mod
+        return mod
+
+    def __getattr__(self, attr: str):
+        return getattr(self.load(), attr)
+
+
+# Тяжёлые модули (~0.8 с импорта) нужны только анализу и рендеру — грузим
+# лениво, чтобы поллер стартовал сразу. Заранее их подтягивает warm_up().
+np = _LazyModule("numpy", "np")
+sps = _LazyModule("scipy.signal", "sps")
+sf = _LazyModule("soundfile", "sf")
+lameenc = _LazyModule("lameenc", "lameenc")
+Image = _LazyModule("PIL.Image", "Image")
+ImageDraw = _LazyModule("PIL.ImageDraw", "ImageDraw")
+ImageFont = _LazyModule("PIL.ImageFont", "ImageFont")
+ImageOps = _LazyModule("PIL.ImageOps", "ImageOps")
 
 # ---------------------------------------------------------------- config
 
+_STARTED = time.monotonic()  # для замера времени до первого поллинга
 BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
 CHANNEL_ID = os.environ.get("TELEGRAM_CHANNEL_ID", "")
 # 0 = непрерывная проверка (запрос за запросом без пауз).
@@ -52,14 +127,107 @@ MAX_ATTEMPTS = int(os.environ.get("MAX_ATTEMPTS", "5"))
 # Bypass-детект: трек считается "пробившим" лимиты, если громче этих порогов
 BYPASS_LUFS = float(os.environ.get("BYPASS_LUFS", "-2"))
 BYPASS_PEAK_DB = float(os.environ.get("BYPASS_PEAK_DB", "6"))
-DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "posted.db")
-FONTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+# "1" — сравнивать с BYPASS_PEAK_DB true-peak (BS.1770, 4x oversampling, ловит
+# межсэмпловые перегрузки), а не sample peak
+BYPASS_TRUE_PEAK = os.environ.get("BYPASS_TRUE_PEAK", "0") == "1"
+DB_PATH = os.environ.get("DB_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "posted.db")
+# Локальный кэш шрифтов: положи сюда Inter-*.ttf заранее — и сеть при старте не нужна
+FONTS_DIR = os.environ.get("FONTS_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+# "0" — FONTS_DIR заполнен заранее (офлайн, бенчмарки): ничего не качать,
+# недостающие шрифты заменит шрифт Pillow по умолчанию
+FONTS_DOWNLOAD = os.environ.get("FONTS_DOWNLOAD", "1") == "1"
 # Постоянно обновляющийся список артистов, заливающих bypassed-аудио
-ARTISTS_TXT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bypassed_artists.txt")
+ARTISTS_TXT = os.environ.get("ARTISTS_TXT") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "bypassed_artists.txt"
+)
+# Быстрый старт: поллер запускается первым, остальное догружается в фоне
+FAST_START = os.environ.get("FAST_START", "1") != "0"
+# Порядок разбора очереди: "fifo" — по времени добавления (хронология в канале),
+# "priority" — сначала треки с наибольшей вероятностью bypass (повторные
+# нарушители из bypassed_artists, ключевые слова в названии).
+QUEUE_MODE = os.environ.get("QUEUE_MODE", "fifo")
+# Старение в режиме priority: сколько очков приоритета трек набирает за минуту
+# ожидания — чтобы обычные треки не застревали навечно при наплыве.
+QUEUE_AGING = float(os.environ.get("QUEUE_AGING", "1"))
+# Слова в названии трека (через запятую, без учёта регистра), поднимающие приоритет
+PRIORITY_KEYWORDS = [
+    w.strip().lower()
+    for w in os.environ.get("PRIORITY_KEYWORDS", "bass boost,bassboosted,earrape,ear rape,loud,distorted").split(",")
+    if w.strip()
+]
+# Базовые URL внешних сервисов — переопределяются для стабов в бенчмарках (bench/)
+ROBLOX_API_URL = os.environ.get("ROBLOX_API_URL", "https://apis.roblox.com").rstrip("/")
+THUMBNAILS_URL = os.environ.get("THUMBNAILS_URL", "https://thumbnails.roblox.com").rstrip("/")
+# Asset delivery Roblox (редиректит на CDN с самим файлом)
+ASSETDELIVERY_URL = os.environ.get("ASSETDELIVERY_URL", "https://assetdelivery.roblox.com").rstrip("/")
+TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
+# Пауза между опросами обложки в статусе Pending (сек)
+THUMBNAIL_RETRY_DELAY = float(os.environ.get("THUMBNAIL_RETRY_DELAY", "3"))
+# Пре-скрин (только при ONLY_BYPASSED): до полного скачивания Range-запросами
+# берутся OGG-заголовки и окна по PRESCREEN_WINDOW_KB из разных мест файла;
+# если по ним трек тише порогов больше чем на PRESCREEN_MARGIN (LU / dB), он
+# пропускается без скачивания и полного анализа.
+PRESCREEN = os.environ.get("PRESCREEN", "0") == "1"
+PRESCREEN_WINDOW_KB = int(os.environ.get("PRESCREEN_WINDOW_KB", "24"))
+PRESCREEN_MARGIN = float(os.environ.get("PRESCREEN_MARGIN", "3"))
+# Окон не меньше PRESCREEN_WINDOWS, а промежутки между ними короче
+# PRESCREEN_MIN_BURST секунд: громкая вставка такой длины (типичный bypass —
+# тихий трек с громким куском) хоть частью попадёт в окно. Если промежутки всё
+# же вышли длиннее (или окна заняли бы полфайла), трек качается целиком.
+PRESCREEN_WINDOWS = int(os.environ.get("PRESCREEN_WINDOWS", "8"))
+PRESCREEN_MIN_BURST = float(os.environ.get("PRESCREEN_MIN_BURST", "5"))
 # Каждые сколько секунд печатать heartbeat-статистику (что бот жив и работает)
 HEARTBEAT_SECONDS = int(os.environ.get("HEARTBEAT_SECONDS", "60"))
+# Профили громкости в БД (100 мс субблоки + пик + waveform) — чтобы пересчитать
+# вердикты под новые пороги без повторного декодирования. "float32" — точно,
+# "float16" — вдвое компактнее (хранится в dB), "off" — не сохранять.
+PROFILE_DTYPE = os.environ.get("PROFILE_DTYPE", "float32")
+# Этапы анализа через запятую (peak,true_peak,stereo,waveform,loudness,mp3).
+# Пусто — по режиму постинга: при ONLY_BYPASSED=1 mp3 и стерео-детект
+# считаются только для треков, которые пойдут в канал.
+ANALYSIS_STAGES = [n.strip() for n in os.environ.get("ANALYSIS_STAGES", "").split(",") if n.strip()]
+# Стерео, у которого энергия side (L-R) ниже mid (L+R) больше чем на столько dB,
+# считается псевдо-стерео (моно, разложенное на два почти одинаковых канала)
+FAKE_STEREO_DB = float(os.environ.get("FAKE_STEREO_DB", "-30"))
+# Лимит Telegram на сообщения в один канал (пост = 2 сообщения: фото + mp3)
+TG_MESSAGES_PER_MINUTE = float(os.environ.get("TG_MESSAGES_PER_MINUTE", "20"))
+TG_BURST = float(os.environ.get("TG_BURST", "2"))
+# Сколько раз повторять один упавший вызов Bot API (429 / 5xx / соединение не установилось)
+TG_MAX_RETRIES = int(os.environ.get("TG_MAX_RETRIES", "5"))
+# Карточка: формат png / jpeg / webp, качество (jpeg/webp) и сторона в px.
+# Telegram всё равно пережимает фото в JPEG, так что png — лишние байты на аплоаде.
+CARD_FORMAT = os.environ.get("CARD_FORMAT", "jpeg").lower()
+CARD_QUALITY = int(os.environ.get("CARD_QUALITY", "90"))
+CARD_SIZE = int(os.environ.get("CARD_SIZE", "1080"))
+# Как опрашивать COLLECT_STRATEGIES: "hedge" — основная стратегия, а если она
+# не ответила за HEDGE_DELAY, параллельно запасная; "all" — все сразу с
+# объединением результатов; "off" — по очереди, следующая только после отказа.
+HEDGE_MODE = os.environ.get("HEDGE_MODE", "hedge")
+# Бюджет латентности основной стратегии (сек); пусто — p95 её недавних ответов
+HEDGE_DELAY = os.environ.get("HEDGE_DELAY", "")
+# Порт HTTP-эндпоинтов /metrics (Prometheus) и /healthz; 0 — выключены
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+# /healthz падает, если поллер или воркер не делали ни одного шага дольше этого (сек)
+HEALTH_STALL_SECONDS = float(os.environ.get("HEALTH_STALL_SECONDS", "0")) or max(300.0, 3 * CHECK_INTERVAL)
+# Куда писать JSON с гистограммами латентностей (каждый heartbeat); пусто — не писать
+METRICS_JSON = os.environ.get("METRICS_JSON", "")
+# Сэмплирующий профайлер: "collapsed" (стеки для flamegraph) или "pstats"; пусто — выключен
+PROFILER = os.environ.get("PROFILER", "")
+# Куда профайлер сбрасывает результат (по умолчанию profile.txt / profile.pstats рядом с ботом)
+PROFILE_OUT = os.environ.get("PROFILE_OUT", "") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "profile." + ("txt" if PROFILER == "collapsed" else "pstats")
+)
+# Период сэмплирования стеков профайлером (сек)
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
 
 DISTROKID_CREATOR_ID = 7135127272
+# Список отслеживаемых создателей (ID аккаунтов Roblox через запятую). Все
+# обслуживаются одним процессом: общая БД, общая очередь и общий бюджет
+# запросов — за один поллинг опрашивается один создатель (см. CreatorScheduler).
+WATCH_CREATORS = [
+    c.strip() for c in os.environ.get("WATCH_CREATORS", str(DISTROKID_CREATOR_ID)).split(",") if c.strip()
+]
 UA = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
     "(KHTML, like Gecko) Chrome/126.0 Safari/537.36"
@@ -78,6 +246,14 @@ WAVEFORM_BUCKETS = 96
 CARD_W, CARD_H = 1080, 1080
 MARGIN = 88
 COVER_SIZE = 440
+# Требования Bot API к thumbnail: JPEG, не больше 320x320 и 200 КБ
+THUMB_SIZE = 320
+# Имя файла и MIME карточки по CARD_FORMAT
+CARD_FILES = {
+    "png": ("card.png", "image/png"),
+    "jpeg": ("card.jpg", "image/jpeg"),
+    "webp": ("card.webp", "image/webp"),
+}
 
 FONT_URLS = {
     "Inter-Regular.ttf": "https://fonts.gstatic.com/s/inter/v20/UcCO3FwrK3iLTeHuS_nVMrMxCp50SjIw2boKoduKmMEVuLyfMZg.ttf",
@@ -93,6 +269,306 @@ logging.basicConfig(
 )
 log = logging.getLogger("distrokid-bot")
 
+# ---------------------------------------------------------------- instrumentation
+
+
+class Histogram:
+    """HDR-подобная гистограмма латентностей: логарифмические бакеты шириной
+    ~1% (значение хранится с точностью до 1%), O(1) запись, память — только
+    под реально встретившиеся бакеты (не больше пары тысяч на 1 мкс..1000 с)."""
+
+    GROWTH = math.log(1.01)
+
+    def __init__(self):
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        b = math.floor(math.log(max(seconds, 1e-6)) / self.GROWTH)
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, q: float) -> float:
+        """Верхняя граница бакета, в который попал q-й перцентиль."""
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= rank:
+                return min(math.exp((b + 1) * self.GROWTH), self.max)
+        return self.max
+
+    def copy(self) -> Histogram:
+        h = Histogram()
+        h.buckets, h.count, h.total, h.max = dict(self.buckets), self.count, self.total, self.max
+        return h
+
+    def since(self, prev: Histogram | None) -> Histogram:
+        """Только записи после prev (copy() этой же гистограммы). Точный max
+        интервала не хранится: если общий max не вырос, берётся верхняя
+        граница старшего бакета интервала."""
+        if prev is None:
+            return self.copy()
+        h = Histogram()
+        for b, n in self.buckets.items():
+            n -= prev.buckets.get(b, 0)
+            if n:
+                h.buckets[b] = n
+        h.count, h.total = self.count - prev.count, self.total - prev.total
+        if self.max > prev.max:
+            h.max = self.max
+        elif h.buckets:
+            h.max = min(math.exp((max(h.buckets) + 1) * self.GROWTH), self.max)
+        return h
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+_metrics_lock = threading.Lock()
+_histograms: dict[str, Histogram] = {}
+
+
+def record_span(name: str, seconds: float):
+    with _metrics_lock:
+        h = _histograms.get(name)
+        if h is None:
+            h = _histograms[name] = Histogram()
+        h.record(seconds)
+
+
+@contextmanager
+def span(name: str):
+    """Замер участка кода в гистограмму name. perf_counter монотонный —
+    переводы системных часов замеры не ломают."""
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - t)
+
+
+def timed(name: str):
+    """Декоратор: каждый вызов функции — спан name (в т.ч. упавший)."""
+
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return inner
+
+    return wrap
+
+
+# Счётчики и отметки живости для /metrics и /healthz — только в памяти,
+# чтобы скрейп ничего не стоил (никаких запросов к БД).
+_counters: dict[str, float] = {}
+_ticks: dict[str, float] = {}  # поток -> monotonic последнего шага
+_queue_mirror: dict[int, float] = {}  # asset_id -> enqueued_at (копия очереди из БД)
+
+
+def count(name: str, n: float = 1):
+    with _metrics_lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def tick(name: str):
+    """Отметка «поток жив и сделал шаг» (для /healthz)."""
+    with _metrics_lock:
+        _ticks[name] = time.monotonic()
+
+
+def metrics_snapshot() -> dict:
+    with _metrics_lock:
+        return {name: h.summary() for name, h in sorted(_histograms.items())}
+
+
+_interval_marks: dict[str, Histogram] = {}  # копии гистограмм на прошлом вызове interval_snapshot
+
+
+def interval_snapshot() -> dict:
+    """Сводки только за время с прошлого вызова (для heartbeat) — в отличие
+    от накопительных metrics_snapshot и /metrics. Спаны без новых записей
+    пропускаются."""
+    out = {}
+    with _metrics_lock:
+        for name, h in sorted(_histograms.items()):
+            delta = h.since(_interval_marks.get(name))
+            _interval_marks[name] = h.copy()
+            if delta.count:
+                out[name] = delta.summary()
+    return out
+
+
+def format_spans(snapshot: dict) -> str:
+    return "; ".join(
+        f"{name} n={m['count']} p50 {_fmt_sec(m['p50'])} p95 {_fmt_sec(m['p95'])} p99 {_fmt_sec(m['p99'])}"
+        for name, m in snapshot.items()
+    )
+
+
+def _fmt_sec(v: float) -> str:
+    return f"{v * 1000:.1f}ms" if v < 1 else f"{v:.2f}s"
+
+
+def dump_metrics_json(path: str, snapshot: dict, interval: dict):
+    """spans — накопительно с запуска, interval — с прошлого heartbeat."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"time": time.time(), "spans": snapshot, "interval": interval}, f, indent=1)
+    os.replace(tmp, path)
+
+
+class SamplingProfiler(threading.Thread):
+    """Опциональный сэмплирующий профайлер всех потоков: раз в interval
+    снимает стеки через sys._current_frames() и раз в HEARTBEAT_SECONDS
+    пишет накопленное — свёрнутые стеки ("a;b;c 42", формат flamegraph.pl /
+    speedscope) или pstats (читается pstats.Stats / snakeviz; время = число
+    сэмплов * interval). В отличие от cProfile почти не тормозит горячий путь."""
+
+    def __init__(self, mode: str, path: str, interval: float):
+        super().__init__(daemon=True, name="profiler")
+        self.mode = mode
+        self.path = path
+        self.interval = interval
+        self.stacks: dict[tuple, int] = {}
+
+    def run(self):
+        me = threading.get_ident()
+        next_dump = time.monotonic() + HEARTBEAT_SECONDS
+        while True:
+            time.sleep(self.interval)
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                key = (names.get(tid, str(tid)), *reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            if time.monotonic() >= next_dump:
+                self.dump()
+                next_dump = time.monotonic() + HEARTBEAT_SECONDS
+
+    def dump(self):
+        tmp = self.path + ".tmp"
+        if self.mode == "collapsed":
+            with open(tmp, "w", encoding="utf-8") as f:
+                for (thread, *frames), n in self.stacks.items():
+                    names = [thread] + [f"{os.path.basename(fn)}:{func}" for fn, _, func in frames]
+                    f.write(";".join(names) + f" {n}\n")
+        else:
+            with open(tmp, "wb") as f:
+                marshal.dump(self._pstats(), f)
+        os.replace(tmp, self.path)
+
+    def _pstats(self) -> dict:
+        # {func: (prim_calls, calls, self_time, cum_time, {caller: (...)})}, "вызов" = сэмпл
+        own: dict[tuple, int] = {}
+        cum: dict[tuple, int] = {}
+        callers: dict[tuple, dict[tuple, int]] = {}
+        for (_, *frames), n in self.stacks.items():
+            if not frames:
+                continue
+            own[frames[-1]] = own.get(frames[-1], 0) + n
+            for fn in set(frames):  # рекурсия не должна удваивать cum
+                cum[fn] = cum.get(fn, 0) + n
+            for caller, callee in set(zip(frames, frames[1:])):
+                edges = callers.setdefault(callee, {})
+                edges[caller] = edges.get(caller, 0) + n
+        iv = self.interval
+        return {
+            fn: (
+                c, c, own.get(fn, 0) * iv, c * iv,
+                {caller: (k, k, k * iv, k * iv) for caller, k in callers.get(fn, {}).items()},
+            )
+            for fn, c in cum.items()
+        }
+
+# ---------------------------------------------------------------- records
+
+
+# Записи, которые ходят по конвейеру, — dataclass со __slots__ вместо dict:
+# без словаря атрибутов на каждый объект, когда их в очереди/бэктесте тысячи.
+
+
+@dataclass(slots=True)
+class Track:
+    """Трек из выдачи Roblox (details) — он же элемент очереди."""
+
+    id: int
+    name: str
+    artist: str
+    created_utc: str
+
+    def to_row(self) -> tuple:
+        """Поля в порядке столбцов asset_id, name, artist, created_utc."""
+        return (self.id, self.name, self.artist, self.created_utc)
+
+
+def _track_row(cursor: sqlite3.Cursor, row: tuple) -> Track:
+    """row_factory для SELECT asset_id, name, artist, created_utc ..."""
+    return Track(*row)
+
+
+@dataclass(slots=True)
+class Analysis:
+    """Результат analyze_and_encode. Поля, кроме первых трёх, заполняют
+    этапы анализа (что вернул их finalize()); не запускавшиеся — None.
+    waveform и loudness_profile — компактные ndarray, не списки."""
+
+    duration: float
+    sample_rate: int
+    channels: int
+    peak_db: float | None = None
+    true_peak_db: float | None = None
+    lufs: float | None = None
+    loudness_profile: np.ndarray | None = None  # mean-square 100 мс субблоков (float64)
+    waveform: np.ndarray | None = None  # WAVEFORM_BUCKETS значений 0..1 (float32)
+    is_stereo: bool | None = None
+    stereo_kind: str | None = None
+    side_mid_db: float | None = None
+    mp3: bytes | None = None
+    stage_times: dict[str, float] = field(default_factory=dict)
+
+    def merge(self, other: Analysis):
+        """Дополняет результат полями второго прохода (кроме stage_times)."""
+        for f in fields(other):
+            value = getattr(other, f.name)
+            if f.name != "stage_times" and value is not None:
+                setattr(self, f.name, value)
+
+
+@dataclass(slots=True)
+class Prescreen:
+    """Результат prescreen_audio."""
+
+    verdict: str = "full"  # "skip" — заведомо тише порогов, "full" — нужен полный анализ
+    url: str | None = None  # адрес на CDN для полного скачивания
+    ogg: bytes | None = None  # файл целиком, если сервер не умеет Range
+    estimate: Analysis | None = None  # анализ склейки окон
+    fetched: int = 0  # скачано байт
+    size: int | None = None  # размер файла
+
+
 # ---------------------------------------------------------------- db
 
 
@@ -120,8 +596,8 @@ def db_connect() -> sqlite3.Connection:
            )"""
     )
     # Персистентная очередь: поллер складывает сюда новые треки, воркер
-    # разбирает по одному (FIFO по seq). Ничего не теряется — даже при
-    # наплыве треков или рестарте процесса.
+    # разбирает по одному (FIFO по seq или по priority со старением, см.
+    # QUEUE_MODE). Ничего не теряется — даже при наплыве треков или рестарте.
     # ВАЖНО: seq — отдельный AUTOINCREMENT-столбец. Нельзя использовать
     # asset_id как PRIMARY KEY для порядка: в SQLite он стал бы алиасом
     # rowid, и очередь сортировалась бы по ID ассета, а не по времени
@@ -132,7 +608,9 @@ def db_connect() -> sqlite3.Connection:
              asset_id INTEGER NOT NULL UNIQUE,
              name TEXT,
              artist TEXT,
-             created_utc TEXT
+             created_utc TEXT,
+             priority REAL NOT NULL DEFAULT 0,
+             enqueued_at REAL NOT NULL DEFAULT 0
            )"""
     )
     # Артисты, у которых замечены bypassed-треки. Из этой таблицы
@@ -145,6 +623,62 @@ def db_connect() -> sqlite3.Connection:
              last_seen TEXT NOT NULL DEFAULT (datetime('now'))
            )"""
     )
+    # Профили громкости проанализированных треков: mean-square 100 мс
+    # субблоков (сумма по каналам) и waveform в виде компактных BLOB-ов.
+    # encoding: "f4" — float32 mean-square, "f2db" — float16 в dB.
+    # prescreened = 1 — трек отсеян пре-скрином, профиль только по его окнам.
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS loudness_profiles (
+             asset_id INTEGER PRIMARY KEY,
+             sample_rate INTEGER NOT NULL,
+             channels INTEGER NOT NULL,
+             duration REAL NOT NULL,
+             peak_db REAL NOT NULL,
+             true_peak_db REAL,
+             lufs REAL NOT NULL,
+             encoding TEXT NOT NULL,
+             subblocks BLOB NOT NULL,
+             waveform BLOB NOT NULL,
+             prescreened INTEGER NOT NULL DEFAULT 0,
+             analyzed_at TEXT NOT NULL DEFAULT (datetime('now'))
+           )"""
+    )
+    # Кэш file_id Telegram по sha256 содержимого: одинаковую карточку или mp3
+    # второй раз не загружаем, а шлём ссылкой на уже загруженный файл.
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS tg_file_ids (
+             sha256 TEXT PRIMARY KEY,
+             kind TEXT NOT NULL,
+             file_id TEXT NOT NULL,
+             created_at TEXT NOT NULL DEFAULT (datetime('now'))
+           )"""
+    )
+    # Отслеживаемые создатели: seeded_at — когда их каталог был запомнен без
+    # постинга (у каждого создателя — один раз), upload_rate — оценка частоты
+    # загрузок (треков/сек) для планировщика, чтобы не начинать с нуля.
+    had_creators = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'creators'"
+    ).fetchone()
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS creators (
+             creator_id INTEGER PRIMARY KEY,
+             seeded_at TEXT,
+             upload_rate REAL NOT NULL DEFAULT 0
+           )"""
+    )
+    # Миграция: до списка создателей бот следил только за DistroKid — если
+    # база уже не пустая, его каталог засеян и повторно сеять не нужно.
+    if not had_creators and conn.execute("SELECT 1 FROM posted_assets LIMIT 1").fetchone():
+        conn.execute(
+            "INSERT OR IGNORE INTO creators (creator_id, seeded_at) VALUES (?, datetime('now'))",
+            (DISTROKID_CREATOR_ID,),
+        )
+    # Миграция: true-peak появился в профилях позже (у старых строк — NULL)
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(loudness_profiles)").fetchall()]
+    if "true_peak_db" not in cols:
+        conn.execute("ALTER TABLE loudness_profiles ADD COLUMN true_peak_db REAL")
+    if "prescreened" not in cols:
+        conn.execute("ALTER TABLE loudness_profiles ADD COLUMN prescreened INTEGER NOT NULL DEFAULT 0")
     # Миграция со старой схемы (asset_id был PRIMARY KEY, без seq)
     cols = [r[1] for r in conn.execute("PRAGMA table_info(queue)").fetchall()]
     if "seq" not in cols:
@@ -163,51 +697,109 @@ def db_connect() -> sqlite3.Connection:
             "SELECT asset_id, name, artist, created_utc FROM queue_old ORDER BY rowid"
         )
         conn.execute("DROP TABLE queue_old")
+    # Миграция: приоритет и время постановки (unix time) появились позже.
+    # У старых строк enqueued_at = 0 — при старении они уйдут первыми.
+    cols = [r[1] for r in conn.execute("PRAGMA table_info(queue)").fetchall()]
+    if "priority" not in cols:
+        conn.execute("ALTER TABLE queue ADD COLUMN priority REAL NOT NULL DEFAULT 0")
+        conn.execute("ALTER TABLE queue ADD COLUMN enqueued_at REAL NOT NULL DEFAULT 0")
     conn.commit()
     return conn
 
 
-def enqueue(conn: sqlite3.Connection, item: dict):
-    conn.execute(
-        "INSERT OR IGNORE INTO queue (asset_id, name, artist, created_utc) VALUES (?, ?, ?, ?)",
-        (item["id"], item["name"], item["artist"], item["created_utc"]),
-    )
-    conn.commit()
-
-
-def queue_next(conn: sqlite3.Connection) -> dict | None:
+@timed("db.queue_priority")
+def queue_priority(conn: sqlite3.Connection, item: Track) -> float:
+    """Оценка вероятности bypass по дешёвым метаданным (0..~120): история
+    артиста в bypassed_artists — число треков (с насыщением) и давность
+    последнего (полураспад ~3 недели) — плюс ключевые слова в названии."""
+    score = 0.0
     row = conn.execute(
-        "SELECT asset_id, name, artist, created_utc FROM queue ORDER BY seq LIMIT 1"
+        "SELECT tracks, julianday('now') - julianday(last_seen) FROM bypassed_artists WHERE artist = ?",
+        (item.artist,),
     ).fetchone()
-    if not row:
-        return None
-    return {"id": row[0], "name": row[1], "artist": row[2], "created_utc": row[3]}
+    if row:
+        tracks, age_days = row
+        score += 100.0 * (1.0 - math.exp(-tracks / 2.0)) * math.exp(-max(age_days, 0.0) / 30.0)
+    title = item.name.lower()
+    if any(w in title for w in PRIORITY_KEYWORDS):
+        score += 20.0
+    return score
+
+
+@timed("db.enqueue")
+def enqueue(conn: sqlite3.Connection, item: Track) -> float:
+    """Ставит трек в очередь; возвращает его приоритет."""
+    priority = queue_priority(conn, item)
+    now = time.time()
+    cur = conn.execute(
+        "INSERT OR IGNORE INTO queue (asset_id, name, artist, created_utc, priority, enqueued_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (*item.to_row(), priority, now),
+    )
+    conn.commit()
+    if cur.rowcount:
+        with _metrics_lock:
+            _queue_mirror[item.id] = now
+    return priority
+
+
+@timed("db.queue_next")
+def queue_next(conn: sqlite3.Connection) -> Track | None:
+    if QUEUE_MODE == "priority":
+        # Старение: за каждую минуту ожидания +QUEUE_AGING к приоритету
+        cur = conn.execute(
+            "SELECT asset_id, name, artist, created_utc FROM queue "
+            "ORDER BY priority + (? - enqueued_at) / 60.0 * ? DESC, seq LIMIT 1",
+            (time.time(), QUEUE_AGING),
+        )
+    else:
+        cur = conn.execute("SELECT asset_id, name, artist, created_utc FROM queue ORDER BY seq LIMIT 1")
+    cur.row_factory = _track_row
+    return cur.fetchone()
 
 
+@timed("db.dequeue")
 def dequeue(conn: sqlite3.Connection, asset_id: int):
     conn.execute("DELETE FROM queue WHERE asset_id = ?", (asset_id,))
     conn.commit()
+    with _metrics_lock:
+        _queue_mirror.pop(asset_id, None)
 
 
-def requeue_to_back(conn: sqlite3.Connection, item: dict):
-    """Переставляет неудавшийся трек в конец очереди (новый seq)."""
-    conn.execute("DELETE FROM queue WHERE asset_id = ?", (item["id"],))
+@timed("db.requeue_to_back")
+def requeue_to_back(conn: sqlite3.Connection, item: Track):
+    """Переставляет неудавшийся трек в конец очереди (новый seq; в режиме
+    priority — ещё и нулевой приоритет, иначе он сразу же вышел бы снова)."""
+    conn.execute("DELETE FROM queue WHERE asset_id = ?", (item.id,))
     conn.execute(
-        "INSERT INTO queue (asset_id, name, artist, created_utc) VALUES (?, ?, ?, ?)",
-        (item["id"], item["name"], item["artist"], item["created_utc"]),
+        "INSERT INTO queue (asset_id, name, artist, created_utc, enqueued_at) VALUES (?, ?, ?, ?, ?)",
+        (*item.to_row(), time.time()),
     )
     conn.commit()
 
 
+def load_queue_mirror(conn: sqlite3.Connection):
+    """Один раз при старте: копия очереди в память для /metrics."""
+    rows = conn.execute("SELECT asset_id, enqueued_at FROM queue").fetchall()
+    now = time.time()
+    with _metrics_lock:
+        _queue_mirror.clear()
+        # у строк до миграции enqueued_at = 0 — считаем их поставленными сейчас
+        _queue_mirror.update((asset_id, t or now) for asset_id, t in rows)
+
+
+@timed("db.queue_size")
 def queue_size(conn: sqlite3.Connection) -> int:
     (n,) = conn.execute("SELECT COUNT(*) FROM queue").fetchone()
     return n
 
 
+@timed("db.in_queue")
 def in_queue(conn: sqlite3.Connection, asset_id: int) -> bool:
     return conn.execute("SELECT 1 FROM queue WHERE asset_id = ?", (asset_id,)).fetchone() is not None
 
 
+@timed("db.get_attempts")
 def get_attempts(conn: sqlite3.Connection, asset_id: int) -> int:
     row = conn.execute(
         "SELECT count FROM attempts WHERE asset_id = ?", (asset_id,)
@@ -215,6 +807,7 @@ def get_attempts(conn: sqlite3.Connection, asset_id: int) -> int:
     return row[0] if row else 0
 
 
+@timed("db.bump_attempt")
 def bump_attempt(conn: sqlite3.Connection, asset_id: int) -> int:
     """Увеличивает счётчик попыток и СРАЗУ коммитит (до рискованной обработки)."""
     conn.execute(
@@ -226,6 +819,7 @@ def bump_attempt(conn: sqlite3.Connection, asset_id: int) -> int:
     return get_attempts(conn, asset_id)
 
 
+@timed("db.record_bypassed_artist")
 def record_bypassed_artist(conn: sqlite3.Connection, artist: str):
     """Фиксирует артиста с bypassed-треком и перегенерирует bypassed_artists.txt."""
     if not artist:
@@ -262,11 +856,38 @@ def rewrite_artists_txt(conn: sqlite3.Connection):
     log.info("bypassed_artists.txt updated: %d artists", len(rows))
 
 
-def is_first_run(conn: sqlite3.Connection) -> bool:
-    (count,) = conn.execute("SELECT COUNT(*) FROM posted_assets").fetchone()
-    return count == 0
+@timed("db.creator_seeded")
+def creator_seeded(conn: sqlite3.Connection, creator: int) -> bool:
+    row = conn.execute("SELECT seeded_at FROM creators WHERE creator_id = ?", (creator,)).fetchone()
+    return row is not None and row[0] is not None
+
+
+@timed("db.mark_creator_seeded")
+def mark_creator_seeded(conn: sqlite3.Connection, creator: int):
+    conn.execute(
+        "INSERT INTO creators (creator_id, seeded_at) VALUES (?, datetime('now')) "
+        "ON CONFLICT(creator_id) DO UPDATE SET seeded_at = excluded.seeded_at",
+        (creator,),
+    )
+    conn.commit()
+
+
+@timed("db.load_creator_rates")
+def load_creator_rates(conn: sqlite3.Connection) -> dict[int, float]:
+    return dict(conn.execute("SELECT creator_id, upload_rate FROM creators").fetchall())
+
+
+@timed("db.save_creator_rates")
+def save_creator_rates(conn: sqlite3.Connection, rates: dict[int, float]):
+    conn.executemany(
+        "INSERT INTO creators (creator_id, upload_rate) VALUES (?, ?) "
+        "ON CONFLICT(creator_id) DO UPDATE SET upload_rate = excluded.upload_rate",
+        list(rates.items()),
+    )
+    conn.commit()
 
 
+@timed("db.already_posted")
 def already_posted(conn: sqlite3.Connection, asset_id: int) -> bool:
     row = conn.execute(
         "SELECT 1 FROM posted_assets WHERE asset_id = ?", (asset_id,)
@@ -274,57 +895,256 @@ def already_posted(conn: sqlite3.Connection, asset_id: int) -> bool:
     return row is not None
 
 
-def mark_posted(conn, asset_id: int, name: str, artist: str, created_utc: str, seeded: bool):
+@timed("db.mark_posted")
+def mark_posted(conn, item: Track, seeded: bool):
     conn.execute(
         "INSERT OR IGNORE INTO posted_assets (asset_id, name, artist, created_utc, seeded)"
         " VALUES (?, ?, ?, ?, ?)",
-        (asset_id, name, artist, created_utc, 1 if seeded else 0),
+        (*item.to_row(), 1 if seeded else 0),
+    )
+    conn.commit()
+
+
+@timed("db.cached_file_id")
+def cached_file_id(conn: sqlite3.Connection, digest: str) -> str | None:
+    row = conn.execute("SELECT file_id FROM tg_file_ids WHERE sha256 = ?", (digest,)).fetchone()
+    return row[0] if row else None
+
+
+@timed("db.remember_file_id")
+def remember_file_id(conn: sqlite3.Connection, digest: str, kind: str, file_id: str):
+    conn.execute(
+        "INSERT OR REPLACE INTO tg_file_ids (sha256, kind, file_id) VALUES (?, ?, ?)",
+        (digest, kind, file_id),
+    )
+    conn.commit()
+
+
+@timed("db.forget_file_id")
+def forget_file_id(conn: sqlite3.Connection, digest: str):
+    conn.execute("DELETE FROM tg_file_ids WHERE sha256 = ?", (digest,))
+    conn.commit()
+
+
+@timed("db.save_profile")
+def save_profile(conn: sqlite3.Connection, asset_id: int, a: Analysis, prescreened: bool = False):
+    """Сохраняет профиль громкости трека (перезаписывает при повторном анализе).
+    prescreened — это оценка пре-скрина по окнам, а не полный анализ."""
+    if PROFILE_DTYPE == "off":
+        return
+    sub = a.loudness_profile
+    if PROFILE_DTYPE == "float16":
+        # float16 не держит mean-square тихих участков (~1e-7), а в dB — легко
+        encoding = "f2db"
+        blob = (10 * np.log10(sub + 1e-12)).astype(np.float16).tobytes()
+    else:
+        encoding = "f4"
+        blob = sub.astype(np.float32).tobytes()
+    conn.execute(
+        "INSERT OR REPLACE INTO loudness_profiles (asset_id, sample_rate, channels, duration, "
+        "peak_db, true_peak_db, lufs, encoding, subblocks, waveform, prescreened) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (
+            asset_id, a.sample_rate, a.channels, a.duration, a.peak_db,
+            a.true_peak_db, a.lufs, encoding, blob,
+            np.asarray(a.waveform if a.waveform is not None else [], dtype=np.float16).tobytes(),
+            1 if prescreened else 0,
+        ),
     )
     conn.commit()
 
 
+def _decode_subblocks(encoding: str, blob: bytes) -> np.ndarray:
+    if encoding == "f2db":
+        return 10 ** (np.frombuffer(blob, dtype=np.float16).astype(np.float64) / 10)
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+def load_profile(conn: sqlite3.Connection, asset_id: int) -> Analysis | None:
+    """Сохранённый анализ одного трека — обратно к save_profile (без mp3 и
+    стерео, их в loudness_profiles нет). None, если профиля нет."""
+    row = conn.execute(
+        "SELECT duration, sample_rate, channels, peak_db, true_peak_db, lufs, encoding, subblocks, waveform "
+        "FROM loudness_profiles WHERE asset_id = ?",
+        (asset_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    *head, encoding, blob, waveform = row
+    return Analysis(
+        *head,
+        loudness_profile=_decode_subblocks(encoding, blob),
+        waveform=np.frombuffer(waveform, dtype=np.float16).astype(np.float32) if waveform else None,
+    )
+
+
+def load_profiles(conn: sqlite3.Connection) -> dict:
+    """Читает все профили разом в плоские массивы: subblocks всех треков
+    склеены подряд, bounds — границы треков, blocks — их 400 мс блоки,
+    подготовленные для гейтинга (_sorted_blocks). Формат для rescore_profiles."""
+    rows = conn.execute(
+        "SELECT asset_id, peak_db, true_peak_db, lufs, prescreened, encoding, subblocks "
+        "FROM loudness_profiles ORDER BY asset_id"
+    ).fetchall()
+    parts = [_decode_subblocks(enc, blob) for *_, enc, blob in rows]
+    bounds = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in parts], out=bounds[1:])
+    subblocks = np.concatenate(parts) if parts else np.zeros(0)
+    return {
+        "asset_id": np.array([r[0] for r in rows], dtype=np.int64),
+        "peak_db": np.array([r[1] for r in rows], dtype=np.float64),
+        # старые профили без true-peak — NaN
+        "true_peak_db": np.array([r[2] for r in rows], dtype=np.float64),
+        "lufs": np.array([r[3] for r in rows], dtype=np.float64),
+        # профили отсеянных пре-скрином треков — только по окнам
+        "prescreened": np.array([r[4] for r in rows], dtype=bool),
+        "subblocks": subblocks,
+        "bounds": bounds,
+        "blocks": _sorted_blocks(subblocks, bounds),
+    }
+
+
 # ---------------------------------------------------------------- roblox api
 
 
 # Стратегии сбора: если основная вдруг перестаёт отдавать данные (Roblox
 # меняет API, режет параметры для конкретных IP и т.п.), бот автоматически
-# переключается на следующую и продолжает работать.
+# переключается на следующую и продолжает работать. Это шаблоны: {creator}
+# подставляется при опросе, статистика стратегий общая для всех создателей.
 COLLECT_STRATEGIES = [
     (
         "creator+sortIntent",  # то, что использует сама страница distrokid-hits
-        f"creatorTargetId={DISTROKID_CREATOR_ID}&creatorType=1&audioTypes=0"
-        f"&uiSortIntent=10&sortDirection=Descending",
+        "creatorTargetId={creator}&creatorType=1&audioTypes=0"
+        "&uiSortIntent=10&sortDirection=Descending",
     ),
     (
         "creator+createTime",
-        f"creatorTargetId={DISTROKID_CREATOR_ID}&creatorType=1&audioTypes=0"
-        f"&sortCategory=CreateTime&sortDirection=Descending",
+        "creatorTargetId={creator}&creatorType=1&audioTypes=0"
+        "&sortCategory=CreateTime&sortDirection=Descending",
     ),
     (
         "creator-only",
-        f"creatorTargetId={DISTROKID_CREATOR_ID}&creatorType=1",
+        "creatorTargetId={creator}&creatorType=1",
     ),
 ]
-_active_strategy = 0  # индекс последней сработавшей стратегии
+_active_strategy = 0  # индекс последней сработавшей (лучшей) стратегии
+
+
+class StrategyStats:
+    """Скользящая (EWMA) статистика стратегии сбора: латентность, доля
+    отказов (ошибка или пустой ответ) и свежесть — был ли в ответе самый
+    новый из виденных ID. По score() стратегии ранжируются автоматически.
+    Не опрошенная ещё стратегия получает нейтральный score (NEUTRAL): она не
+    обгоняет работающую основную, но и не хоронится под отказавшими."""
+
+    ALPHA = 0.2
+    NEUTRAL = 0.5
+
+    def __init__(self):
+        self.calls = 0
+        self.latency = 0.0
+        self.errors = 0.0
+        self.fresh: float | None = None  # ещё ни одного непустого ответа
+
+    def update(self, latency: float, ok: bool, fresh: bool | None):
+        a = self.ALPHA if self.calls else 1.0
+        self.calls += 1
+        self.latency += a * (latency - self.latency)
+        self.errors += a * ((0.0 if ok else 1.0) - self.errors)
+        if fresh is not None:
+            value = 1.0 if fresh else 0.0
+            self.fresh = value if self.fresh is None else self.fresh + self.ALPHA * (value - self.fresh)
+
+    def score(self) -> float:
+        if not self.calls:
+            return self.NEUTRAL
+        # свежесть и надёжность важнее скорости; 1 с латентности ~ 10% отказов
+        fresh = self.NEUTRAL if self.fresh is None else self.fresh
+        return fresh - self.errors - 0.1 * self.latency
+
+
+_collect_lock = threading.Lock()
+_strategy_stats = {name: StrategyStats() for name, _ in COLLECT_STRATEGIES}
+_newest_seen: dict[int, int] = {}  # создатель -> самый новый виденный asset ID (мерило свежести)
+_collect_pool: ThreadPoolExecutor | None = None
+# Ответы запасных стратегий, пришедшие уже после того, как hedged-опрос
+# вернул результат: их ID добавляются к следующему опросу того же создателя
+# (ассет, видный только в одной сортировке, не теряется), а 429 от них
+# превращается в backoff на следующем опросе.
+_late_ids: dict[int, set[int]] = {}
+_late_429: requests.HTTPError | None = None
 
 
 def _marketplace_ids(params: str, limit: int) -> list[int]:
-    url = f"https://apis.roblox.com/toolbox-service/v1/marketplace/3?limit={limit}&{params}"
+    url = f"{ROBLOX_API_URL}/toolbox-service/v1/marketplace/3?limit={limit}&{params}"
     r = SESSION.get(url, headers=HEADERS, timeout=30)
     r.raise_for_status()
     return [d["id"] for d in r.json().get("data", [])]
 
 
-def fetch_latest_ids(limit: int = 50) -> list[int]:
-    """Пробует стратегии сбора по кругу, начиная с последней рабочей.
+def _run_strategy(idx: int, creator: int, limit: int) -> list[int]:
+    """Один запрос стратегии + учёт статистики (в т.ч. для ответов, которые
+    пришли уже после того, как hedged-запрос вернул результат)."""
+    name, params = COLLECT_STRATEGIES[idx]
+    t = time.perf_counter()
+    ids: list[int] = []
+    try:
+        ids = _marketplace_ids(params.format(creator=creator), limit)
+        return ids
+    finally:
+        latency = time.perf_counter() - t
+        record_span(f"collect.{name}", latency)
+        with _collect_lock:
+            fresh = None
+            if ids:
+                newest = _newest_seen.get(creator, 0)
+                fresh = max(ids) >= newest
+                _newest_seen[creator] = max(newest, max(ids))
+            _strategy_stats[name].update(latency, bool(ids), fresh)
+
+
+def ranked_strategies() -> list[int]:
+    """Индексы стратегий от лучшей к худшей (при равенстве — порядок в списке)."""
+    with _collect_lock:
+        scores = [_strategy_stats[name].score() for name, _ in COLLECT_STRATEGIES]
+    return sorted(range(len(COLLECT_STRATEGIES)), key=lambda i: -scores[i])
+
+
+def _hedge_delay(idx: int) -> float:
+    if HEDGE_DELAY:
+        return float(HEDGE_DELAY)
+    with _metrics_lock:
+        h = _histograms.get(f"collect.{COLLECT_STRATEGIES[idx][0]}")
+        p95 = h.percentile(95) if h is not None and h.count >= 10 else 1.0
+    return min(max(p95, 0.2), 5.0)
+
+
+def format_strategy_stats() -> str:
+    with _collect_lock:
+        return "; ".join(
+            f"{name} n={st.calls} {st.latency:.2f}s "
+            f"fresh {'?' if st.fresh is None else f'{st.fresh:.0%}'} fail {st.errors:.0%}"
+            for name, st in _strategy_stats.items()
+        )
+
+
+def fetch_latest_ids(creator: int, limit: int = 50) -> list[int]:
+    """Свежие asset ID создателя по стратегиям сбора (см. HEDGE_MODE).
     429 пробрасывается наверх — им занимается poller_loop (Retry-After)."""
+    if HEDGE_MODE == "off":
+        return _fetch_sequential(creator, limit)
+    return _fetch_hedged(creator, limit)
+
+
+def _fetch_sequential(creator: int, limit: int) -> list[int]:
+    """Пробует стратегии сбора по кругу, начиная с последней рабочей."""
     global _active_strategy
     last_err: Exception | None = None
     for offset in range(len(COLLECT_STRATEGIES)):
         idx = (_active_strategy + offset) % len(COLLECT_STRATEGIES)
-        name, params = COLLECT_STRATEGIES[idx]
+        name, _ = COLLECT_STRATEGIES[idx]
         try:
-            ids = _marketplace_ids(params, limit)
+            ids = _run_strategy(idx, creator, limit)
             if ids:
                 if idx != _active_strategy:
                     log.warning("collection strategy switched to '%s' (previous returned nothing)", name)
@@ -345,11 +1165,128 @@ def fetch_latest_ids(limit: int = 50) -> list[int]:
     return []
 
 
-def fetch_details(asset_ids: list[int]) -> list[dict]:
+def _is_429(e: Exception) -> bool:
+    return isinstance(e, requests.HTTPError) and e.response is not None and e.response.status_code == 429
+
+
+def _late_result(creator: int, fut):
+    """done-callback брошенного hedged-запроса: ID — в копилку следующего
+    опроса, 429 — в сигнал backoff (статистику уже учёл _run_strategy)."""
+    global _late_429
+    if fut.cancelled():
+        return
+    e = fut.exception()
+    with _collect_lock:
+        if e is None and fut.result():
+            _late_ids.setdefault(creator, set()).update(fut.result())
+        elif e is not None and _is_429(e):
+            _late_429 = e
+
+
+def _abandon(running: dict, creator: int):
+    """Оставшиеся запросы: ещё не начатые отменяем (не тратим бюджет Roblox),
+    а уже летящие дослушиваем в фоне (см. _late_result)."""
+    for fut in running:
+        if not fut.cancel():
+            fut.add_done_callback(functools.partial(_late_result, creator))
+
+
+def _fetch_hedged(creator: int, limit: int) -> list[int]:
+    """Hedged-опрос: стартует лучшая по статистике стратегия; если она не
+    уложилась в бюджет латентности (или упала / ответила пустотой) —
+    параллельно запускается следующая. В режиме "all" — все сразу.
+    Результаты всех успевших стратегий объединяются без дублей (новые
+    сверху) вместе с запоздавшими ответами прошлого опроса (_late_ids).
+    429 от любой стратегии — сигнал backoff для poller_loop: уже собранные
+    ID при этом не теряются, а дожидаются следующего опроса."""
+    global _active_strategy, _collect_pool, _late_429
+    with _collect_lock:
+        rate_limited, _late_429 = _late_429, None
+        late = _late_ids.pop(creator, set())
+    if rate_limited is not None:
+        with _collect_lock:
+            _late_ids.setdefault(creator, set()).update(late)
+        raise rate_limited  # запоздавший 429 прошлого опроса
+
+    if _collect_pool is None:
+        _collect_pool = ThreadPoolExecutor(max_workers=2 * len(COLLECT_STRATEGIES), thread_name_prefix="collect")
+    order = ranked_strategies()
+    pending = list(order)
+    running: dict = {}
+
+    def launch():
+        idx = pending.pop(0)
+        running[_collect_pool.submit(_run_strategy, idx, creator, limit)] = idx
+
+    launch()
+    while HEDGE_MODE == "all" and pending:
+        launch()
+
+    results: dict[int, list[int]] = {}
+    last_err: Exception | None = None
+    while running:
+        done, _ = wait(running, timeout=_hedge_delay(order[0]) if pending else None, return_when=FIRST_COMPLETED)
+        if not done:
+            log.debug("collection over latency budget — hedging with '%s'", COLLECT_STRATEGIES[pending[0]][0])
+            launch()
+            continue
+        for fut in done:
+            idx = running.pop(fut)
+            name = COLLECT_STRATEGIES[idx][0]
+            try:
+                ids = fut.result()
+            except requests.HTTPError as e:
+                if _is_429(e):
+                    # rate limit обрабатывает poller_loop; собранное — следующему опросу
+                    _abandon(running, creator)
+                    with _collect_lock:
+                        _late_ids.setdefault(creator, set()).update(late, *results.values())
+                    raise
+                body = (e.response.text[:200] if e.response is not None else "")
+                log.warning("strategy '%s' failed: %s %s", name, e, body)
+                last_err = e
+                continue
+            except Exception as e:
+                log.warning("strategy '%s' failed: %s", name, e)
+                last_err = e
+                continue
+            if ids:
+                results[idx] = ids
+            else:
+                log.warning("strategy '%s' returned 0 ids", name)
+        if results and (HEDGE_MODE != "all" or not running):
+            break
+        if not results and not running and pending:
+            launch()  # отказ без ожидания бюджета — сразу следующая
+    _abandon(running, creator)
+
+    if not results:
+        if late:
+            return sorted(late, reverse=True)
+        if last_err is not None:
+            raise last_err
+        return []
+    best = min(results, key=order.index)
+    if best != _active_strategy:
+        log.info("collection strategy now '%s'", COLLECT_STRATEGIES[best][0])
+        _active_strategy = best
+    return sorted(late.union(*results.values()), reverse=True)
+
+
+DETAILS_BATCH = 50
+
+
+def fetch_details(asset_ids: list[int]) -> list[Track]:
+    # объединённый ответ нескольких стратегий может быть длиннее limit — бьём на пачки
+    if len(asset_ids) > DETAILS_BATCH:
+        return [
+            d for k in range(0, len(asset_ids), DETAILS_BATCH)
+            for d in fetch_details(asset_ids[k : k + DETAILS_BATCH])
+        ]
     if not asset_ids:
         return []
     ids = ",".join(str(i) for i in asset_ids)
-    url = f"https://apis.roblox.com/toolbox-service/v1/items/details?assetIds={ids}"
+    url = f"{ROBLOX_API_URL}/toolbox-service/v1/items/details?assetIds={ids}"
     r = SESSION.get(url, headers=HEADERS, timeout=30)
     r.raise_for_status()
     items = []
@@ -358,23 +1295,25 @@ def fetch_details(asset_ids: list[int]) -> list[dict]:
         audio = asset.get("audioDetails") or {}
         creator = it.get("creator") or {}
         items.append(
-            {
-                "id": asset["id"],
-                "name": audio.get("title") or asset.get("name", "Unknown"),
-                "artist": audio.get("artist") or creator.get("name") or "Unknown",
-                "created_utc": asset.get("createdUtc", ""),
-            }
+            Track(
+                id=asset["id"],
+                name=audio.get("title") or asset.get("name", "Unknown"),
+                artist=audio.get("artist") or creator.get("name") or "Unknown",
+                created_utc=asset.get("createdUtc", ""),
+            )
         )
     return items
 
 
-def fetch_thumbnail(asset_id: int, retries: int = 5, delay: float = 3.0) -> bytes | None:
+@timed("fetch_thumbnail")
+def fetch_thumbnail(asset_id: int, retries: int = 5, delay: float | None = None) -> bytes | None:
     """Тянет обложку. У только что залитых аудио превью часто ещё в статусе
     Pending — поэтому опрашиваем несколько раз, ожидая Completed."""
+    delay = THUMBNAIL_RETRY_DELAY if delay is None else delay
     for attempt in range(retries):
         try:
             r = SESSION.get(
-                f"https://thumbnails.roblox.com/v1/assets?assetIds={asset_id}&size=420x420&format=Png",
+                f"{THUMBNAILS_URL}/v1/assets?assetIds={asset_id}&size=420x420&format=Png",
                 headers=HEADERS,
                 timeout=30,
             )
@@ -404,20 +1343,51 @@ def fetch_thumbnail(asset_id: int, retries: int = 5, delay: float = 3.0) -> byte
     return None
 
 
-def download_audio(asset_id: int) -> bytes:
+@timed("download_audio")
+def download_audio(asset_id: int, url: str | None = None) -> bytes:
+    """Скачивает аудио целиком. url — уже известный адрес на CDN (после
+    пре-скрина), чтобы не ходить через редирект второй раз."""
     r = SESSION.get(
-        f"https://assetdelivery.roblox.com/v1/asset?id={asset_id}",
+        url or f"{ASSETDELIVERY_URL}/v1/asset?id={asset_id}",
         timeout=60,
         allow_redirects=True,
     )
     r.raise_for_status()
-    buf = r.content
+    return _gunzip_raw(r.content)
+
+
+def _gunzip_raw(buf: bytes) -> bytes:
     # Иногда прилетает сырой gzip без заголовка Content-Encoding
     if len(buf) > 2 and buf[0] == 0x1F and buf[1] == 0x8B:
         buf = gzip.decompress(buf)
     return buf
 
 
+@timed("resolve_cdn_url")
+def resolve_cdn_url(asset_id: int) -> str | None:
+    """Адрес файла на CDN из редиректа asset delivery (None — редиректа нет)."""
+    r = SESSION.get(
+        f"{ASSETDELIVERY_URL}/v1/asset?id={asset_id}", timeout=30, allow_redirects=False, stream=True
+    )
+    with r:
+        if r.is_redirect:
+            return urllib.parse.urljoin(r.url, r.headers["Location"])
+        r.raise_for_status()
+    return None
+
+
+@timed("fetch_range")
+def fetch_range(url: str, start: int, end: int) -> tuple[bytes, int | None]:
+    """Байты [start, end] файла и его полный размер. Если сервер Range не
+    поддерживает (200 вместо 206), вернётся весь файл и размер None."""
+    r = SESSION.get(url, headers={"Range": f"bytes={start}-{end}"}, timeout=30)
+    r.raise_for_status()
+    if r.status_code != 206:
+        return r.content, None
+    total = r.headers.get("Content-Range", "").rpartition("/")[2]
+    return r.content, int(total) if total.isdigit() else None
+
+
 def asset_url(asset_id: int) -> str:
     return f"https://create.roblox.com/store/asset/{asset_id}"
 
@@ -446,116 +1416,349 @@ def _target_mp3_rate(sr: int) -> int:
     return min(candidates, key=lambda r: abs(r - sr))
 
 
-def analyze_and_encode(ogg: bytes) -> dict:
-    """Потоково декодирует OGG: считает LUFS / peak dB / waveform и на лету
-    кодирует MP3 (с даунсемплом до <=48 кГц). Память почти не зависит от длины трека."""
-    bio = io.BytesIO(ogg)
-    with sf.SoundFile(bio) as f:
-        sr = f.samplerate
-        ch = f.channels
-        total = max(1, f.frames)
-        duration = total / sr
+class AnalyzerStage:
+    """Этап потокового анализа. feed() получает каждый декодированный блок
+    float32 (кадры, каналы) — один и тот же массив для всех этапов, только для
+    чтения (не копировать без нужды и не менять). finalize() возвращает поля
+    Analysis, которые заполнит этот этап."""
 
-        target_sr = _target_mp3_rate(sr)
-        mp3_ch = min(ch, 2)
-        enc = lameenc.Encoder()
-        enc.set_bit_rate(192)
-        enc.set_in_sample_rate(target_sr)
-        enc.set_channels(mp3_ch)
-        enc.set_quality(5)  # быстрее кодирование при 192 kbps, разница на слух неразличима
-        mp3 = bytearray()
-
-        up = down = 1
-        if target_sr != sr:
-            g = math.gcd(target_sr, sr)
-            up, down = target_sr // g, sr // g
+    name = ""
 
-        # K-weighting (ITU-R BS.1770), состояние фильтров тянем между блоками
-        sb, sa = _shelf_coeffs(sr)
-        hb, ha = _highpass_coeffs(sr)
-        zi_s = [np.zeros(max(len(sa), len(sb)) - 1) for _ in range(ch)]
-        zi_h = [np.zeros(max(len(ha), len(hb)) - 1) for _ in range(ch)]
+    def __init__(self, sr: int, channels: int, frames: int):
+        self.sr = sr
+        self.channels = channels
+        self.frames = frames
 
-        sub_len = max(1, round(0.1 * sr))  # субблок 100 мс
-        sub_ms: list[np.ndarray] = []      # per-channel mean-square на каждый субблок
-        carry = np.zeros((0, ch))          # хвост взвешенных сэмплов между блоками
+    def feed(self, block: np.ndarray):
+        raise NotImplementedError
 
-        peak = 0.0
-        stereo = False
-        buckets_sumsq = np.zeros(WAVEFORM_BUCKETS)
-        buckets_cnt = np.zeros(WAVEFORM_BUCKETS)
+    def finalize(self) -> dict:
+        raise NotImplementedError
 
-        frame_pos = 0
-        block_frames = BLOCK_SECONDS * sr
 
-        while True:
-            block = f.read(block_frames, dtype="float32", always_2d=True)
-            bn = block.shape[0]
-            if bn == 0:
-                break
+class PeakStage(AnalyzerStage):
+    """Sample peak (dBFS)."""
 
-            bmax = float(np.max(np.abs(block)))
-            if bmax > peak:
-                peak = bmax
+    name = "peak"
 
-            if ch >= 2 and not stereo and np.any(np.abs(block[:, 0] - block[:, 1]) > 1e-4):
-                stereo = True
+    def __init__(self, sr: int, channels: int, frames: int):
+        super().__init__(sr, channels, frames)
+        self.peak = 0.0
 
-            # waveform: раскладываем блок по глобальным бакетам
-            mono = block.mean(axis=1).astype(np.float64)
-            idx = np.clip(
-                (np.arange(frame_pos, frame_pos + bn) * WAVEFORM_BUCKETS) // total,
-                0,
-                WAVEFORM_BUCKETS - 1,
-            )
-            np.add.at(buckets_sumsq, idx, mono**2)
-            np.add.at(buckets_cnt, idx, 1.0)
-
-            # K-weighting поканально с сохранением состояния
-            weighted = np.empty((bn, ch))
-            for c in range(ch):
-                y1, zi_s[c] = lfilter(sb, sa, block[:, c].astype(np.float64), zi=zi_s[c])
-                y2, zi_h[c] = lfilter(hb, ha, y1, zi=zi_h[c])
-                weighted[:, c] = y2
-            if carry.shape[0]:
-                weighted = np.vstack([carry, weighted])
-            nfull = weighted.shape[0] // sub_len
-            if nfull:
-                used = nfull * sub_len
-                ms = (weighted[:used].reshape(nfull, sub_len, ch) ** 2).mean(axis=1)
-                sub_ms.extend(ms)
-                carry = weighted[used:].copy()
-            else:
-                carry = weighted
+    def feed(self, block: np.ndarray):
+        self.peak = max(self.peak, float(block.max()), -float(block.min()))
 
-            # mp3: даунсемпл блока и инкрементальное кодирование
-            res = block[:, :mp3_ch] if up == 1 and down == 1 else resample_poly(block[:, :mp3_ch], up, down, axis=0)
-            i16 = np.clip(res * 32767.0, -32768, 32767).astype(np.int16)
-            inter = i16[:, 0] if mp3_ch == 1 else i16.reshape(-1)
-            mp3 += enc.encode(inter.tobytes())
+    def finalize(self) -> dict:
+        return {"peak_db": 20 * math.log10(self.peak) if self.peak > 0 else float("-inf")}
 
-            frame_pos += bn
 
-        mp3 += enc.flush()
+# 4x полифазный интерполятор true-peak из ITU-R BS.1770-4, Annex 2 (4 фазы по 12 тапов)
+_TRUE_PEAK_PHASES = (
+    (0.0017089843750, 0.0109863281250, -0.0196533203125, 0.0332031250000,
+     -0.0594482421875, 0.1373291015625, 0.9721679687500, -0.1022949218750,
+     0.0476074218750, -0.0266113281250, 0.0148925781250, -0.0083007812500),
+    (-0.0291748046875, 0.0292968750000, -0.0517578125000, 0.0891113281250,
+     -0.1665039062500, 0.4650878906250, 0.7797851562500, -0.2003173828125,
+     0.1015625000000, -0.0582275390625, 0.0330810546875, -0.0189208984375),
+    (-0.0189208984375, 0.0330810546875, -0.0582275390625, 0.1015625000000,
+     -0.2003173828125, 0.7797851562500, 0.4650878906250, -0.1665039062500,
+     0.0891113281250, -0.0517578125000, 0.0292968750000, -0.0291748046875),
+    (-0.0083007812500, 0.0148925781250, -0.0266113281250, 0.0476074218750,
+     -0.1022949218750, 0.9721679687500, 0.1373291015625, -0.0594482421875,
+     0.0332031250000, -0.0196533203125, 0.0109863281250, 0.0017089843750),
+)
 
-    peak_db = 20 * math.log10(peak) if peak > 0 else float("-inf")
-    lufs = _lufs_from_subblocks(sub_ms)
 
-    with np.errstate(invalid="ignore", divide="ignore"):
-        rms = np.sqrt(np.where(buckets_cnt > 0, buckets_sumsq / np.maximum(buckets_cnt, 1), 0.0))
-    mx = float(rms.max()) or 1e-9
-    waveform = (rms / mx).tolist()
+class TruePeakStage(AnalyzerStage):
+    """Потоковый true-peak метр (BS.1770, 4x oversampling), общий на все каналы.
+
+    Полифазная свёртка сведена к одному матричному умножению: сигнал режется
+    на строки по ROW сэмплов (+11 сэмплов истории фильтра), строки всех
+    каналов умножаются на тёплицеву матрицу (ROW + 11, 4 * ROW) — это один
+    BLAS-вызов вместо 4 фильтров на канал, заметно дешевле K-weighting.
+    История и недобранный до строки хвост переносятся в следующий блок."""
+
+    name = "true_peak"
+    ROW = 32
+    TAPS = 12
+    CHUNK_ROWS = 1024  # строк за одно умножение: результат ~1 МБ, помещается в кэш
+
+    def __init__(self, sr: int, channels: int, frames: int):
+        super().__init__(sr, channels, frames)
+        taps = np.asarray(_TRUE_PEAK_PHASES, dtype=np.float32)  # (фаза, тап)
+        hist = self.TAPS - 1
+        self._kernel = np.zeros((self.ROW + hist, 4 * self.ROW), dtype=np.float32)
+        k = np.arange(self.TAPS)
+        for r in range(self.ROW):
+            for p in range(4):
+                # фаза p сэмпла r: sum_k taps[p, k] * x[r - k]
+                self._kernel[r + hist - k, 4 * r + p] = taps[p]
+        # Шов между блоками фиксированного размера: история фильтра + недобранная
+        # строка (< ROW + TAPS - 1 кадров) и начало следующего блока — две строки
+        self._buf = np.zeros((2 * self.ROW + hist, channels), dtype=np.float32)
+        self._n = hist  # кадров в _buf; вначале история — нули
+        self.peak = 0.0
+
+    def _rows(self, x: np.ndarray) -> int:
+        """Пики всех целых строк x (кадры, каналы), начиная с кадра 0.
+        Возвращает, сколько кадров ушло в строки (история остаётся)."""
+        width = self.ROW + self.TAPS - 1
+        nrows = (len(x) - (self.TAPS - 1)) // self.ROW
+        if nrows <= 0:
+            return 0
+        # Вид без копии: (строки, каналы, width); копируется только чанк под умножение
+        rows = np.lib.stride_tricks.sliding_window_view(x, width, axis=0)[: nrows * self.ROW : self.ROW]
+        for s in range(0, nrows, self.CHUNK_ROWS):
+            y = rows[s : s + self.CHUNK_ROWS].reshape(-1, width) @ self._kernel
+            self.peak = max(self.peak, float(y.max()), -float(y.min()))
+        return nrows * self.ROW
+
+    def feed(self, block: np.ndarray):
+        # Блок фильтруется на месте, вдоль оси кадров: в буфер шва копируется
+        # только его начало, а не весь блок (как было с concatenate + .T)
+        n = self._n
+        take = min(len(block), len(self._buf) - n)
+        self._buf[n : n + take] = block[:take]
+        used = self._rows(self._buf[: n + take])
+        if take < len(block):
+            # Буфер полон: его строки закончились не раньше начала блока
+            # (used = 2 * ROW > n), дальше строки идут прямо по блоку
+            body = block[used - n :]
+            rest = body[self._rows(body) :]
+        else:
+            rest = self._buf[used : n + take]
+        self._n = len(rest)
+        self._buf[: self._n] = rest
+
+    def finalize(self) -> dict:
+        """Докручивает хвост фильтра нулями."""
+        pad = self.TAPS - 1 + (-self._n) % self.ROW  # + выравнивание до целой строки
+        self.feed(np.zeros((pad, self._buf.shape[1]), dtype=np.float32))
+        return {"true_peak_db": 20 * math.log10(self.peak) if self.peak > 0 else float("-inf")}
+
+
+class StereoStage(AnalyzerStage):
+    """Стерео / моно / псевдо-стерео.
+
+    Каналы 0 и 1 сначала сравниваются на прореженной выборке (каждый
+    STRIDE-й кадр) — у настоящего стерео расхождение > 1e-4 находится сразу.
+    Полное сравнение всех кадров нужно, только пока разницы не нашлось, и
+    идёт кусками в переиспользуемый буфер, без временных массивов длиной в
+    блок. По той же выборке копятся энергии side (L-R) и mid (L+R): их
+    отношение отделяет псевдо-стерео (каналы почти одинаковы) от настоящего."""
+
+    name = "stereo"
+    STRIDE = 8
+    CHUNK = 65536
+
+    def __init__(self, sr: int, channels: int, frames: int):
+        super().__init__(sr, channels, frames)
+        self.stereo = False
+        self.side = 0.0
+        self.mid = 0.0
+        self._buf = np.empty(0, dtype=np.float32)
+
+    def feed(self, block: np.ndarray):
+        if self.channels < 2:
+            return
+        left = block[:: self.STRIDE, 0]
+        right = block[:: self.STRIDE, 1]
+        n = left.shape[0]
+        if self._buf.shape[0] < max(n, self.CHUNK):
+            self._buf = np.empty(max(n, self.CHUNK), dtype=np.float32)
+        d = self._buf[:n]
+        np.add(left, right, out=d)
+        self.mid += float(np.dot(d, d))
+        np.subtract(left, right, out=d)
+        self.side += float(np.dot(d, d))
+        if self.stereo:
+            return
+        if float(np.abs(d, out=d).max(initial=0.0)) > 1e-4:
+            self.stereo = True
+            return
+        # На выборке каналы совпали — проверяем все кадры
+        for s in range(0, block.shape[0], self.CHUNK):
+            c = self._buf[: min(self.CHUNK, block.shape[0] - s)]
+            np.subtract(block[s : s + self.CHUNK, 0], block[s : s + self.CHUNK, 1], out=c)
+            if float(np.abs(c, out=c).max()) > 1e-4:
+                self.stereo = True
+                return
+
+    def finalize(self) -> dict:
+        side_mid_db = 10 * math.log10(self.side / self.mid) if self.side > 0 and self.mid > 0 else float("-inf")
+        if not self.stereo:
+            kind = "mono"
+        elif side_mid_db < FAKE_STEREO_DB:
+            kind = "fake"
+        else:
+            kind = "stereo"
+        return {"is_stereo": self.stereo, "stereo_kind": kind, "side_mid_db": side_mid_db}
+
+
+class WaveformStage(AnalyzerStage):
+    """RMS по WAVEFORM_BUCKETS равным кускам трека, нормированный к 1."""
+
+    name = "waveform"
+
+    def __init__(self, sr: int, channels: int, frames: int):
+        super().__init__(sr, channels, frames)
+        self.sumsq = np.zeros(WAVEFORM_BUCKETS)
+        self.cnt = np.zeros(WAVEFORM_BUCKETS)
+        self.pos = 0
+
+    def feed(self, block: np.ndarray):
+        # раскладываем блок по глобальным бакетам
+        bn = block.shape[0]
+        mono = block.mean(axis=1).astype(np.float64)
+        idx = np.clip(
+            (np.arange(self.pos, self.pos + bn) * WAVEFORM_BUCKETS) // self.frames,
+            0,
+            WAVEFORM_BUCKETS - 1,
+        )
+        # idx монотонный — bincount в разы быстрее np.add.at
+        self.sumsq += np.bincount(idx, weights=mono**2, minlength=WAVEFORM_BUCKETS)
+        self.cnt += np.bincount(idx, minlength=WAVEFORM_BUCKETS)
+        self.pos += bn
+
+    def finalize(self) -> dict:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rms = np.sqrt(np.where(self.cnt > 0, self.sumsq / np.maximum(self.cnt, 1), 0.0))
+        mx = float(rms.max()) or 1e-9
+        return {"waveform": (rms / mx).astype(np.float32)}
+
+
+class LoudnessStage(AnalyzerStage):
+    """Integrated LUFS (BS.1770): K-weighting поканально, состояние фильтров
+    тянем между блоками, копим mean-square 100 мс субблоков."""
+
+    name = "loudness"
+
+    def __init__(self, sr: int, channels: int, frames: int):
+        super().__init__(sr, channels, frames)
+        self.sb, self.sa = _shelf_coeffs(sr)
+        self.hb, self.ha = _highpass_coeffs(sr)
+        self.zi_s = [np.zeros(max(len(self.sa), len(self.sb)) - 1) for _ in range(channels)]
+        self.zi_h = [np.zeros(max(len(self.ha), len(self.hb)) - 1) for _ in range(channels)]
+        self.sub_len = max(1, round(0.1 * sr))  # субблок 100 мс
+        self.sub_ms: list[np.ndarray] = []      # mean-square субблоков (сумма по каналам)
+        self.carry = np.zeros((0, channels))    # хвост взвешенных сэмплов между блоками
+
+    def feed(self, block: np.ndarray):
+        bn, ch = block.shape
+        weighted = np.empty((bn, ch))
+        for c in range(ch):
+            y1, self.zi_s[c] = sps.lfilter(self.sb, self.sa, block[:, c].astype(np.float64), zi=self.zi_s[c])
+            y2, self.zi_h[c] = sps.lfilter(self.hb, self.ha, y1, zi=self.zi_h[c])
+            weighted[:, c] = y2
+        if self.carry.shape[0]:
+            weighted = np.vstack([self.carry, weighted])
+        nfull = weighted.shape[0] // self.sub_len
+        if nfull:
+            used = nfull * self.sub_len
+            ms = (weighted[:used].reshape(nfull, self.sub_len, ch) ** 2).mean(axis=1)
+            self.sub_ms.append(ms.sum(axis=1))  # веса каналов 1.0 — можно сложить сразу
+            self.carry = weighted[used:].copy()
+        else:
+            self.carry = weighted
+
+    def finalize(self) -> dict:
+        profile = np.concatenate(self.sub_ms) if self.sub_ms else np.zeros(0)
+        return {"lufs": _lufs_from_subblocks(profile), "loudness_profile": profile}
+
+
+class Mp3Stage(AnalyzerStage):
+    """Инкрементальное кодирование MP3 192 kbps с даунсемплом до <=48 кГц."""
+
+    name = "mp3"
+
+    def __init__(self, sr: int, channels: int, frames: int):
+        super().__init__(sr, channels, frames)
+        target_sr = _target_mp3_rate(sr)
+        self.mp3_ch = min(channels, 2)
+        self.enc = lameenc.Encoder()
+        self.enc.set_bit_rate(192)
+        self.enc.set_in_sample_rate(target_sr)
+        self.enc.set_channels(self.mp3_ch)
+        self.enc.set_quality(5)  # быстрее кодирование при 192 kbps, разница на слух неразличима
+        self.mp3 = bytearray()
+        self.up = self.down = 1
+        if target_sr != sr:
+            g = math.gcd(target_sr, sr)
+            self.up, self.down = target_sr // g, sr // g
 
-    return {
-        "duration": duration,
-        "sample_rate": sr,
-        "channels": ch,
-        "is_stereo": bool(stereo),
-        "peak_db": peak_db,
-        "lufs": lufs,
-        "waveform": waveform,
-        "mp3": bytes(mp3),
-    }
+    def feed(self, block: np.ndarray):
+        src = block[:, : self.mp3_ch]
+        res = src if self.up == 1 and self.down == 1 else sps.resample_poly(src, self.up, self.down, axis=0)
+        i16 = np.clip(res * 32767.0, -32768, 32767).astype(np.int16)
+        inter = i16[:, 0] if self.mp3_ch == 1 else i16.reshape(-1)
+        self.mp3 += self.enc.encode(inter.tobytes())
+
+    def finalize(self) -> dict:
+        self.mp3 += self.enc.flush()
+        return {"mp3": bytes(self.mp3)}
+
+
+ANALYZER_STAGES: dict[str, type[AnalyzerStage]] = {
+    st.name: st for st in (PeakStage, TruePeakStage, StereoStage, WaveformStage, LoudnessStage, Mp3Stage)
+}
+
+
+def analysis_plan() -> tuple[list[str], list[str]]:
+    """Какие этапы считать сразу, а какие отложить до решения постить трек.
+    Вердикту bypass нужны только пики и громкость; mp3 и стерео-детект в
+    режиме ONLY_BYPASSED считаются вторым проходом лишь для bypassed-треков."""
+    if ANALYSIS_STAGES:
+        first = list(ANALYSIS_STAGES)
+    elif ONLY_BYPASSED:
+        first = ["peak", "true_peak", "loudness", "waveform"]
+    else:
+        first = list(ANALYZER_STAGES)
+    for name in ("peak", "loudness"):
+        if name not in first:
+            first.append(name)
+    if BYPASS_TRUE_PEAK and "true_peak" not in first:
+        first.append("true_peak")
+    deferred = [n for n in ANALYZER_STAGES if n not in first]
+    return first, deferred
+
+
+@timed("analyze_and_encode")
+def analyze_and_encode(ogg: bytes, stages: list[str] | None = None) -> Analysis:
+    """Потоково декодирует OGG и прогоняет каждый блок через этапы анализа
+    (по умолчанию все: peak / true-peak / стерео / waveform / LUFS / mp3).
+    Память почти не зависит от длины трека. Время каждого этапа (и декодера)
+    собирается в stage_times."""
+    names = list(ANALYZER_STAGES) if stages is None else stages
+    bio = io.BytesIO(ogg)
+    with sf.SoundFile(bio) as f:
+        sr = f.samplerate
+        ch = f.channels
+        total = max(1, f.frames)
+        runners = [ANALYZER_STAGES[n](sr, ch, total) for n in names]
+        times = dict.fromkeys(["decode", *names], 0.0)
+        block_frames = BLOCK_SECONDS * sr
+
+        while True:
+            t = time.perf_counter()
+            block = f.read(block_frames, dtype="float32", always_2d=True)
+            times["decode"] += time.perf_counter() - t
+            if block.shape[0] == 0:
+                break
+            block.flags.writeable = False  # общий для всех этапов — никто не должен его менять
+            for st in runners:
+                t = time.perf_counter()
+                st.feed(block)
+                times[st.name] += time.perf_counter() - t
+
+    result = Analysis(duration=total / sr, sample_rate=sr, channels=ch, stage_times=times)
+    for st in runners:
+        t = time.perf_counter()
+        for k, v in st.finalize().items():
+            setattr(result, k, v)
+        times[st.name] += time.perf_counter() - t
+    for name, sec in times.items():
+        record_span(f"analyze.{name}", sec)
+    return result
 
 
 def _shelf_coeffs(fs: float):
@@ -587,39 +1790,366 @@ def _highpass_coeffs(fs: float):
     return b, a
 
 
-def _lufs_from_subblocks(sub_ms: list[np.ndarray]) -> float:
+def _lufs_from_subblocks(sub_ms: np.ndarray) -> float:
     """Integrated loudness по ITU-R BS.1770-4 из накопленных 100 мс субблоков
     (гейтинг абсолютный -70 LUFS + относительный -10 LU)."""
-    if len(sub_ms) < 4:
-        return float("-inf")
-    arr = np.asarray(sub_ms)  # (num_sub, channels), mean-square на канал
-    num = arr.shape[0]
+    return float(_gated_loudness(sub_ms, np.array([0, len(sub_ms)]))[0])
+
+
+def _block_energies(sub_ms: np.ndarray, bounds: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Mean-square 400 мс блоков BS.1770 (4 субблока подряд, шаг 100 мс) и
+    номер трека каждого блока. sub_ms — склеенные субблоки всех треков
+    подряд, bounds — границы треков (len = треков + 1); блоки, залезшие в
+    соседний трек, выброшены."""
+    bounds = np.asarray(bounds, dtype=np.int64)
+    sub = np.asarray(sub_ms, dtype=np.float64)
+    if len(sub) < 4:
+        return np.zeros(0), np.zeros(0, dtype=np.int64)
+    lengths = np.diff(bounds)
+    track = np.repeat(np.arange(len(bounds) - 1), lengths)[:-3]
+    valid = np.arange(len(sub) - 3) + 4 <= bounds[1:][track]
+    energy = ((sub[:-3] + sub[1:-2] + sub[2:-1] + sub[3:]) / 4)[valid]
+    return energy, track[valid]
+
+
+def _gated_loudness(
+    sub_ms: np.ndarray, bounds: np.ndarray, abs_gate: float = -70.0, rel_gate: float = -10.0
+) -> np.ndarray:
+    """Векторный гейтинг BS.1770 сразу для многих треков (формат sub_ms и
+    bounds — как у _block_energies). Возвращает integrated loudness на трек
+    (-inf, если всё отгейтили)."""
+    n_tracks = len(bounds) - 1
+    energy, track = _block_energies(sub_ms, bounds)
+    block_loud = -0.691 + 10 * np.log10(energy + 1e-12)
+
+    def gated_mean(mask: np.ndarray) -> np.ndarray:
+        cnt = np.bincount(track[mask], minlength=n_tracks)
+        tot = np.bincount(track[mask], weights=energy[mask], minlength=n_tracks)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(cnt > 0, -0.691 + 10 * np.log10(tot / np.maximum(cnt, 1)), float("-inf"))
+
+    gate = block_loud > abs_gate
+    rel_threshold = gated_mean(gate) + rel_gate
+    gate &= block_loud > rel_threshold[track]
+    return gated_mean(gate)
+
+
+# Громкость блока в ключе сортировки: номер трека * _BLOCK_SPAN + (LUFS - _BLOCK_MIN).
+# Блок не тише -120.7 LUFS (energy + 1e-12), порог гейта обрезается в тот же диапазон.
+_BLOCK_MIN = -200.0
+_BLOCK_SPAN = 1000.0
+
+
+def _sorted_blocks(sub_ms: np.ndarray, bounds: np.ndarray) -> dict:
+    """Блоки всех треков, один раз отсортированные по (трек, громкость), и
+    накопленные суммы их энергий: любой гейт — это searchsorted по треку, а
+    среднее выше гейта — разность двух сумм. Так rescore_profiles гейтит
+    тысячи треков за миллисекунды, без пересчёта блоков из субблоков."""
+    n_tracks = len(bounds) - 1
+    energy, track = _block_energies(sub_ms, bounds)
+    loud = np.clip(-0.691 + 10 * np.log10(energy + 1e-12) - _BLOCK_MIN, 0.0, _BLOCK_SPAN - 1)
+    key = track * _BLOCK_SPAN + loud
+    order = np.argsort(key)
+    cum = np.zeros(len(order) + 1)
+    np.cumsum(energy[order], out=cum[1:])
+    ends = np.zeros(n_tracks + 1, dtype=np.int64)
+    np.cumsum(np.bincount(track, minlength=n_tracks), out=ends[1:])
+    return {"key": key[order], "cum": cum, "start": ends[:-1], "end": ends[1:]}
+
+
+def _gate_sorted(blocks: dict, abs_gate: float = -70.0, rel_gate: float = -10.0) -> np.ndarray:
+    """То же, что _gated_loudness, по заранее подготовленным _sorted_blocks."""
+    key, cum, start, end = blocks["key"], blocks["cum"], blocks["start"], blocks["end"]
+    base = np.arange(len(start)) * _BLOCK_SPAN
+
+    def first_above(threshold) -> np.ndarray:  # первый блок трека громче порога (строго)
+        t = np.clip(np.asarray(threshold, dtype=np.float64) - _BLOCK_MIN, -1.0, _BLOCK_SPAN - 1)
+        return np.maximum(np.searchsorted(key, base + t, side="right"), start)
+
+    def mean_from(idx: np.ndarray) -> np.ndarray:
+        cnt = end - idx
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(
+                cnt > 0, -0.691 + 10 * np.log10((cum[end] - cum[idx]) / np.maximum(cnt, 1)), float("-inf")
+            )
 
-    # 400 мс окно = 4 субблока подряд, шаг 100 мс (1 субблок)
-    block_loud = []
-    for k in range(0, num - 3):
-        s = arr[k : k + 4].mean(axis=0).sum()  # среднее за 400 мс по каналам, веса 1.0
-        block_loud.append(-0.691 + 10 * math.log10(s + 1e-12))
-    block_loud = np.asarray(block_loud)
+    idx = first_above(abs_gate)
+    rel_threshold = mean_from(idx) + rel_gate
+    # -inf (всё отгейтили) — первый же блок трека, но idx там уже == end
+    idx = np.maximum(idx, first_above(np.where(np.isinf(rel_threshold), _BLOCK_MIN, rel_threshold)))
+    return mean_from(idx)
+
+
+def rescore_profiles(
+    profiles: dict,
+    lufs_threshold: float | None = None,
+    peak_threshold: float | None = None,
+    abs_gate: float = -70.0,
+    rel_gate: float = -10.0,
+    true_peak: bool | None = None,
+) -> dict:
+    """Пересчитывает LUFS и bypass-вердикты по сохранённым профилям (см.
+    load_profiles) с любыми гейтами/порогами — без декодирования аудио.
+    Блоки готовит load_profiles, здесь только гейты: тысячи треков — миллисекунды."""
+    lufs_threshold = BYPASS_LUFS if lufs_threshold is None else lufs_threshold
+    peak_threshold = BYPASS_PEAK_DB if peak_threshold is None else peak_threshold
+    true_peak = BYPASS_TRUE_PEAK if true_peak is None else true_peak
+    lufs = _gate_sorted(profiles["blocks"], abs_gate, rel_gate)
+    peak = profiles["peak_db"]
+    if true_peak:
+        # у профилей без true-peak остаётся sample peak
+        peak = np.where(np.isnan(profiles["true_peak_db"]), peak, profiles["true_peak_db"])
+    return {
+        "asset_id": profiles["asset_id"],
+        "lufs": lufs,
+        "bypassed": (lufs > lufs_threshold) | (peak > peak_threshold),
+    }
 
-    abs_gated = block_loud[block_loud > -70]
-    if abs_gated.size == 0:
-        return float("-inf")
 
-    def mean_energy(vals: np.ndarray) -> float:
-        return float(np.mean(10 ** ((vals + 0.691) / 10)))
+def backtest(conn: sqlite3.Connection, lufs_threshold: float, peak_threshold: float):
+    """Сравнивает вердикты текущих порогов с предложенными по всем профилям в БД."""
+    t = time.time()
+    profiles = load_profiles(conn)
+    t_load = time.time() - t
+    t = time.time()
+    now = rescore_profiles(profiles)
+    new = rescore_profiles(profiles, lufs_threshold, peak_threshold)
+    t_score = time.time() - t
+    gained = profiles["asset_id"][new["bypassed"] & ~now["bypassed"]]
+    lost = profiles["asset_id"][now["bypassed"] & ~new["bypassed"]]
+    log.info(
+        "backtest: %d tracks, %d of them pre-screen estimates (load %.0f ms, rescore %.0f ms)",
+        len(profiles["asset_id"]), int(profiles["prescreened"].sum()), t_load * 1000, t_score * 1000,
+    )
+    log.info("  current  >%s LUFS or >%s dB: %d bypassed", BYPASS_LUFS, BYPASS_PEAK_DB, int(now["bypassed"].sum()))
+    log.info("  proposed >%s LUFS or >%s dB: %d bypassed", lufs_threshold, peak_threshold, int(new["bypassed"].sum()))
+    log.info("  newly bypassed (%d): %s", len(gained), gained.tolist())
+    log.info("  no longer bypassed (%d): %s", len(lost), lost.tolist())
+
+
+# ---------------------------------------------------------------- pre-screen
+
+
+@functools.lru_cache(maxsize=1)
+def _ogg_crc_table() -> tuple[int, ...]:
+    # CRC-32 OGG: полином 0x04C11DB7 без отражения, начальное значение 0
+    table = []
+    for i in range(256):
+        r = i << 24
+        for _ in range(8):
+            r = ((r << 1) ^ 0x04C11DB7) if r & 0x80000000 else r << 1
+        table.append(r & 0xFFFFFFFF)
+    return tuple(table)
+
+
+def _ogg_crc(page: bytes) -> int:
+    """CRC страницы (поле CRC в ней считается нулевым)."""
+    table = _ogg_crc_table()
+    crc = 0
+    for b in page[:22] + b"\0\0\0\0" + page[26:]:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ table[((crc >> 24) & 0xFF) ^ b]
+    return crc
+
+
+def _ogg_crc_ok(page: bytes) -> bool:
+    return _ogg_crc(page) == int.from_bytes(page[22:26], "little")
+
+
+def _ogg_granule(page: bytes) -> int:
+    return int.from_bytes(page[6:14], "little", signed=True)
+
+
+def _ogg_pages(buf: bytes) -> list[bytes]:
+    """Целые OGG-страницы из произвольного куска файла. Первая страница ищется
+    по "OggS" с проверкой CRC (в сжатых данных "OggS" встречается случайно),
+    дальше страницы идут подряд; обрезанная последняя отбрасывается."""
+    pages = []
+    pos = buf.find(b"OggS")
+    synced = False
+    while 0 <= pos and pos + 27 <= len(buf):
+        header_len = 27 + buf[pos + 26]
+        if pos + header_len > len(buf):
+            break
+        size = header_len + sum(buf[pos + 27 : pos + header_len])
+        if pos + size > len(buf):
+            break
+        page = buf[pos : pos + size]
+        if not synced and not _ogg_crc_ok(page):
+            pos = buf.find(b"OggS", pos + 1)
+            continue
+        pages.append(page)
+        synced = True
+        pos += size
+        if buf[pos : pos + 4] != b"OggS":
+            synced = False
+            pos = buf.find(b"OggS", pos)
+    return pages
+
+
+def _ogg_header_len(buf: bytes) -> int | None:
+    """Длина заголовочных страниц Vorbis (identification, comment, setup —
+    первые три пакета) или None, если в buf они ещё не целиком."""
+    packets = 0
+    length = 0
+    for page in _ogg_pages(buf):
+        lacing = page[27 : 27 + page[26]]
+        packets += sum(1 for v in lacing if v < 255)
+        length += len(page)
+        if packets >= 3:
+            return length
+    return None
+
 
-    rel_threshold = -0.691 + 10 * math.log10(mean_energy(abs_gated)) - 10
-    rel_gated = block_loud[block_loud > rel_threshold]
-    if rel_gated.size == 0:
-        return float("-inf")
-    return float(-0.691 + 10 * math.log10(mean_energy(rel_gated)))
+def _vorbis_rate(header: bytes) -> int | None:
+    """Частота дискретизации из identification-пакета Vorbis (None — не Vorbis)."""
+    pages = _ogg_pages(header)
+    if not pages:
+        return None
+    body = pages[0][27 + pages[0][26] :]
+    if not body.startswith(b"\x01vorbis") or len(body) < 16:
+        return None
+    return int.from_bytes(body[12:16], "little") or None
+
+
+def _splice_ogg(header: bytes, windows: list[list[bytes]]) -> bytes:
+    """Склеивает заголовок и страницы из разных мест файла в один OGG.
+
+    Номера страниц не трогаем: по пропуску в них декодер понимает, что был
+    разрыв, выбрасывает недокачанный пакет и начинает заново (перенумерация
+    склеила бы пакеты через разрыв). А вот granule position переписываем в
+    непрерывную шкалу (и пересчитываем CRC): с дырами во времени libsndfile
+    при чтении блоками возвращает одни и те же сэмплы по нескольку раз."""
+    out = [header]
+    base = 0
+    for pages in windows:
+        pages = [p for p in pages if _ogg_granule(p) >= 0]  # -1: на странице не кончается ни один пакет
+        if len(pages) < 2:
+            continue
+        first = _ogg_granule(pages[0])
+        for p in pages:
+            page = bytearray(p)
+            page[6:14] = (base + _ogg_granule(p) - first).to_bytes(8, "little", signed=True)
+            page[22:26] = _ogg_crc(bytes(page)).to_bytes(4, "little")
+            out.append(bytes(page))
+        # запас на пакеты, которые декодер выбросит после разрыва
+        base += _ogg_granule(pages[-1]) - first + 8192
+    return b"".join(out)
+
+
+_prescreen_pool: ThreadPoolExecutor | None = None
+
+
+@timed("prescreen")
+def prescreen_audio(asset_id: int) -> Prescreen:
+    """Оценка громкости по кусочкам файла без полного скачивания.
+
+    Range-запросами (окна — параллельно) берутся заголовочные страницы OGG
+    и окна, равномерно разнесённые по файлу (первое — сразу после
+    заголовков, последнее — в самом конце). Число окон подбирается по
+    битрейту первого окна так, чтобы промежутки между ними были короче
+    PRESCREEN_MIN_BURST; после скачивания промежутки проверяются по granule
+    position страниц. Целые страницы окон склеиваются за заголовком (см.
+    _splice_ogg), склейку анализируют этапы вердикта. Громкая вставка короче
+    PRESCREEN_MIN_BURST (или одиночный пик) может уйти в промежуток — запас
+    PRESCREEN_MARGIN страхует только от недооценки того, что окна видели.
+
+    Пока что-то не получилось (нет Range, не Vorbis, маленький файл, дыры
+    между окнами), verdict остаётся "full"."""
+    res = Prescreen()
+    url = resolve_cdn_url(asset_id)
+    if url is None:
+        return res
+    res.url = url
+    window = PRESCREEN_WINDOW_KB * 1024
+
+    head, size = fetch_range(url, 0, window - 1)
+    res.fetched = len(head)
+    if size is None:
+        res.ogg = _gunzip_raw(head)  # Range не поддерживается — файл уже скачан целиком
+        return res
+    res.size = size
+    if not head.startswith(b"OggS"):
+        return res  # gzip или не OGG — только полный путь
+    header_len = _ogg_header_len(head)
+    while header_len is None and len(head) < min(size, 16 * window):
+        more, _ = fetch_range(url, len(head), 2 * len(head) - 1)  # большой comment (обложка и т.п.)
+        res.fetched += len(more)
+        head += more
+        header_len = _ogg_header_len(head)
+    sr = _vorbis_rate(head)
+    if header_len is None or sr is None:
+        return res
+    first = [p for p in _ogg_pages(head[header_len:]) if _ogg_granule(p) >= 0]
+    if len(first) < 2 or _ogg_granule(first[-1]) <= _ogg_granule(first[0]):
+        return res
+
+    # Сколько окон нужно, чтобы промежуток между соседними был не длиннее
+    # PRESCREEN_MIN_BURST минус 400 мс блок гейтинга BS.1770 (и пакет, который
+    # декодер теряет после разрыва) — по битрейту первого окна. От окна
+    # полезны только целые страницы: обрезки по краям (до страницы с каждой
+    # стороны) не считаем, а на колебания битрейта оставляем 10%.
+    max_gap = PRESCREEN_MIN_BURST - 0.5
+    bytes_per_sec = sum(len(p) for p in first[1:]) / (_ogg_granule(first[-1]) - _ogg_granule(first[0])) * sr
+    usable = window - 2 * max(len(p) for p in first)
+    span_bytes = size - header_len - window
+    stride = 0.9 * (usable + max_gap * bytes_per_sec)
+    # Маленький или слишком «плотный» файл: окна покрыли бы полфайла — проще скачать целиком
+    if usable <= 0 or stride <= 0:
+        return res
+    n = max(PRESCREEN_WINDOWS, math.ceil(span_bytes / stride) + 1)
+    if 2 * n * window > size - header_len:
+        return res
+
+    global _prescreen_pool
+    if _prescreen_pool is None:
+        _prescreen_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prescreen")
+    starts = [header_len + span_bytes * k // (n - 1) for k in range(1, n)]
+    chunks = list(_prescreen_pool.map(lambda start: fetch_range(url, start, start + window - 1)[0], starts))
+    res.fetched += sum(len(c) for c in chunks)
+    windows = [_ogg_pages(head[header_len:])] + [_ogg_pages(c) for c in chunks]
+
+    # Фактические промежутки по granule: битрейт мог смениться, окно — не
+    # распарситься. Начало трека (0) и его конец (последнее окно кончается
+    # вместе с файлом) тоже считаются краями промежутков.
+    edges = [0]
+    for pages in windows:
+        pages = [p for p in pages if _ogg_granule(p) >= 0]
+        if len(pages) >= 2:
+            edges += [_ogg_granule(pages[0]), _ogg_granule(pages[-1])]
+    gaps = [(edges[k + 1] - edges[k]) / sr for k in range(0, len(edges) - 1, 2)]
+    covered = len(edges) == 2 * n + 1  # все окна распарсились
+
+    stages = ["peak", "loudness"] + (["true_peak"] if BYPASS_TRUE_PEAK else [])
+    est = analyze_and_encode(_splice_ogg(head[:header_len], windows), stages)
+    res.estimate = est
+    peak = est.true_peak_db if BYPASS_TRUE_PEAK else est.peak_db
+    if (
+        covered
+        and max(gaps) <= max_gap
+        and est.lufs < BYPASS_LUFS - PRESCREEN_MARGIN
+        and peak < BYPASS_PEAK_DB - PRESCREEN_MARGIN
+    ):
+        res.verdict = "skip"
+    return res
 
 
 # ---------------------------------------------------------------- card rendering
 
 
+# Сброшен, пока warm_up (FAST_START) качает шрифты в фоне: карточка, дошедшая
+# до рендера раньше, ждёт докачки (не дольше FONTS_WAIT_SECONDS), а не
+# уходит в канал со шрифтом Pillow по умолчанию.
+_fonts_ready = threading.Event()
+_fonts_ready.set()
+FONTS_WAIT_SECONDS = 30
+
+
 def ensure_fonts():
+    if not FONTS_DOWNLOAD:
+        missing = [f for f in FONT_URLS if not os.path.exists(os.path.join(FONTS_DIR, f))]
+        if missing:
+            log.warning("FONTS_DOWNLOAD=0 and %s missing in %s — using default font", ", ".join(missing), FONTS_DIR)
+        return
     os.makedirs(FONTS_DIR, exist_ok=True)
     for fname, url in FONT_URLS.items():
         path = os.path.join(FONTS_DIR, fname)
@@ -627,12 +2157,34 @@ def ensure_fonts():
             log.info("downloading font %s", fname)
             r = SESSION.get(url, timeout=30)
             r.raise_for_status()
-            with open(path, "wb") as f:
+            # Через временный файл: рендер в другом потоке не должен увидеть
+            # недописанный TTF по итоговому пути
+            tmp = f"{path}.{os.getpid()}.part"
+            with open(tmp, "wb") as f:
                 f.write(r.content)
+            os.replace(tmp, path)
+
+
+_missing_fonts: set[str] = set()
 
 
 def _font(name: str, size: int) -> ImageFont.FreeTypeFont:
-    return ImageFont.truetype(os.path.join(FONTS_DIR, name), size)
+    path = os.path.join(FONTS_DIR, name)
+    if not os.path.exists(path):
+        _fonts_ready.wait(FONTS_WAIT_SECONDS)
+    if os.path.exists(path):
+        try:
+            return ImageFont.truetype(path, size)
+        except OSError as e:  # битый файл (например, от старой версии без os.replace)
+            log.warning("font %s is unreadable (%s) — using default font", name, e)
+    # Шрифты недоступны — карточка всё равно будет
+    if name not in _missing_fonts:
+        _missing_fonts.add(name)
+        log.warning("font %s not found in %s — using default font", name, FONTS_DIR)
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1
+        return ImageFont.load_default()
 
 
 def _fit_text(draw: ImageDraw.ImageDraw, text: str, font_name: str, max_size: int, max_width: int):
@@ -658,7 +2210,8 @@ def _spaced_text(draw, text: str, cx: int, y: int, font, spacing: int, fill):
         x += w + spacing
 
 
-def render_card(title: str, artist: str, cover: bytes | None, waveform: list[float]) -> bytes:
+@timed("render_card")
+def render_card(title: str, artist: str, cover: bytes | None, waveform: np.ndarray) -> bytes:
     img = Image.new("RGB", (CARD_W, CARD_H), "#ffffff")
     draw = ImageDraw.Draw(img)
 
@@ -699,11 +2252,34 @@ def render_card(title: str, artist: str, cover: bytes | None, waveform: list[flo
     wf_height = CARD_H - wf_top - MARGIN - 20
     _draw_waveform(draw, waveform, MARGIN, wf_top, CARD_W - MARGIN * 2, wf_height)
 
+    if CARD_SIZE != CARD_W:
+        img = img.resize((CARD_SIZE, CARD_SIZE * CARD_H // CARD_W), Image.LANCZOS)
     out = io.BytesIO()
-    img.save(out, "PNG")
+    if CARD_FORMAT == "jpeg":
+        img.save(out, "JPEG", quality=CARD_QUALITY, optimize=True, progressive=True)
+    elif CARD_FORMAT == "webp":
+        img.save(out, "WEBP", quality=CARD_QUALITY, method=4)
+    else:
+        img.save(out, "PNG")
     return out.getvalue()
 
 
+def make_thumbnail(cover: bytes | None) -> bytes | None:
+    """Обложка для sendAudio: JPEG <= 320 px, как требует Bot API (PNG 420x420
+    Telegram молча игнорирует, а мы его ещё и грузили)."""
+    if not cover:
+        return None
+    try:
+        c = Image.open(io.BytesIO(cover)).convert("RGB")
+        c.thumbnail((THUMB_SIZE, THUMB_SIZE), Image.LANCZOS)
+        out = io.BytesIO()
+        c.save(out, "JPEG", quality=85, optimize=True)
+        return out.getvalue()
+    except Exception as e:
+        log.warning("thumbnail conversion failed: %s", e)
+        return None
+
+
 def _cover_fallback(draw, x: int, y: int):
     draw.rectangle([x, y, x + COVER_SIZE, y + COVER_SIZE], fill="#f2f2f2")
     cx, cy = x + COVER_SIZE // 2, y + COVER_SIZE // 2
@@ -712,7 +2288,7 @@ def _cover_fallback(draw, x: int, y: int):
     draw.ellipse([cx - 6, cy - 6, cx + 6, cy + 6], fill="#c9c9c9")
 
 
-def _draw_waveform(draw, waveform: list[float], x: int, y: int, width: int, height: int):
+def _draw_waveform(draw, waveform: np.ndarray, x: int, y: int, width: int, height: int):
     n = len(waveform)
     gap = 4
     bar_w = (width - gap * (n - 1)) / n
@@ -729,46 +2305,317 @@ def _draw_waveform(draw, waveform: list[float], x: int, y: int, width: int, heig
 # ---------------------------------------------------------------- telegram
 
 
+class TelegramError(RuntimeError):
+    """Ошибка Bot API. retry_after — сколько секунд просит подождать
+    Telegram при 429 (parameters.retry_after), иначе None."""
+
+    def __init__(self, method: str, description, error_code: int, retry_after: float | None = None):
+        super().__init__(f"Telegram {method} failed: {description}")
+        self.error_code = error_code
+        self.retry_after = retry_after
+
+
 def _tg(method: str, data: dict, files: dict | None = None) -> dict:
-    r = SESSION.post(
-        f"https://api.telegram.org/bot{BOT_TOKEN}/{method}",
-        data=data,
-        files=files,
-        timeout=120,
-    )
-    j = r.json()
+    with span(f"tg.{method}"):
+        r = SESSION.post(
+            f"{TELEGRAM_API_URL}/bot{BOT_TOKEN}/{method}",
+            data=data,
+            files=files,
+            timeout=120,
+        )
+    try:
+        j = r.json()
+    except ValueError:  # 502 от nginx перед Bot API и т.п. — не JSON
+        raise TelegramError(method, f"HTTP {r.status_code}", r.status_code) from None
     if not j.get("ok"):
-        raise RuntimeError(f"Telegram {method} failed: {j.get('description', r.status_code)}")
+        params = j.get("parameters") or {}
+        raise TelegramError(
+            method, j.get("description", r.status_code), j.get("error_code", r.status_code),
+            params.get("retry_after"),
+        )
     return j["result"]
 
 
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, копится не больше capacity.
+    block() полностью останавливает выдачу (на время retry_after от 429)."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Ждёт токен; возвращает, сколько секунд пришлось ждать."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self.blocked_until:
+                    self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    wait = (1 - self.tokens) / self.rate
+                else:
+                    wait = self.blocked_until - now
+            time.sleep(wait)
+            waited += wait
+
+    def block(self, seconds: float):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            # сразу после паузы доступен ровно один токен — для повтора упавшего вызова
+            self.tokens = 1.0
+            self.updated = self.blocked_until
+
+
+def _not_sent(e: requests.ConnectionError) -> bool:
+    """Соединение не установилось (таймаут подключения, отказ, DNS) — запрос
+    до Telegram не дошёл, и повтор не создаст дубль."""
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+class TelegramPublisher:
+    """Отправка в канал с учётом лимитов Telegram: каждый вызов берёт токен
+    из bucket-а (лимит сообщений в минуту на чат), на 429 ждём ровно
+    retry_after и повторяем только упавший вызов — карточку, которая уже
+    ушла, повторно не шлём. Повторяем также 5xx и соединения, которые не
+    установились (запрос точно не ушёл). Обрыв уже установленного соединения
+    и таймаут чтения не повторяем — сообщение могло дойти, и повтор
+    задублировал бы пост."""
+
+    def __init__(self, per_minute: float, burst: float, max_retries: int):
+        self.bucket = TokenBucket(per_minute / 60.0, burst)
+        self.max_retries = max_retries
+        # накопительно: сколько байт файлов ушло в Bot API и сколько это заняло
+        self.upload_bytes = 0
+        self.upload_seconds = 0.0
+
+    def call(self, method: str, data: dict, files: dict | None = None) -> dict:
+        attempt = 0
+        while True:
+            waited = self.bucket.acquire()
+            if waited > 0.05:
+                log.debug("telegram %s: waited %.1fs for rate limit token", method, waited)
+            t = time.perf_counter()
+            try:
+                return _tg(method, data, files)
+            except TelegramError as e:
+                if attempt >= self.max_retries:
+                    raise
+                if e.retry_after is not None:
+                    log.warning("Telegram rate limit (429) on %s — waiting %ss", method, e.retry_after)
+                    self.bucket.block(float(e.retry_after))
+                elif e.error_code >= 500:
+                    log.warning("%s — retry in %ds", e, 2**attempt)
+                    time.sleep(2**attempt)
+                else:
+                    raise
+            except requests.ConnectionError as e:
+                # HTTPAdapter сам повторяет установку соединения дважды — здесь
+                # дольше пережидаем недоступность Telegram, с backoff
+                if attempt >= self.max_retries or not _not_sent(e):
+                    raise
+                log.warning("Telegram %s: cannot connect (%s) — retry in %ds", method, e, 2**attempt)
+                time.sleep(2**attempt)
+            finally:
+                if files:
+                    self.upload_bytes += sum(len(f[1]) for f in files.values())
+                    self.upload_seconds += time.perf_counter() - t
+            attempt += 1
+
+
 def escape_html(s: str) -> str:
     return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
 
-def send_photo(photo: bytes, caption: str) -> int:
-    result = _tg(
+PUBLISHER = TelegramPublisher(TG_MESSAGES_PER_MINUTE, TG_BURST, TG_MAX_RETRIES)
+
+
+def _send_file(
+    conn: sqlite3.Connection | None, method: str, field: str, data: dict, file: tuple, extra_files: dict
+) -> dict:
+    """Отправляет файл ссылкой (file_id), если такой контент уже загружался,
+    иначе загружает и запоминает file_id из ответа. extra_files (thumbnail)
+    уходят только при загрузке: по file_id Telegram их всё равно игнорирует,
+    а сами thumbnail-ы по file_id переиспользовать нельзя."""
+    digest = hashlib.sha256(file[1]).hexdigest()
+    file_id = cached_file_id(conn, digest) if conn is not None else None
+    if file_id:
+        try:
+            return PUBLISHER.call(method, {**data, field: file_id})
+        except TelegramError as e:
+            if e.error_code != 400:
+                raise
+            log.warning("cached %s file_id rejected (%s) — uploading again", field, e)
+            forget_file_id(conn, digest)
+    result = PUBLISHER.call(method, data, {field: file, **extra_files})
+    uploaded = result.get(field)
+    if isinstance(uploaded, list):  # photo — массив размеров, берём самый большой
+        uploaded = uploaded[-1] if uploaded else None
+    if conn is not None and uploaded and uploaded.get("file_id"):
+        remember_file_id(conn, digest, field, uploaded["file_id"])
+    return result
+
+
+def send_photo(photo: bytes, caption: str, conn: sqlite3.Connection | None = None) -> int:
+    name, mime = CARD_FILES[CARD_FORMAT]
+    result = _send_file(
+        conn,
         "sendPhoto",
+        "photo",
         {"chat_id": CHANNEL_ID, "caption": caption, "parse_mode": "HTML"},
-        {"photo": ("card.png", photo, "image/png")},
+        (name, photo, mime),
+        {},
     )
     return result["message_id"]
 
 
-def send_audio(mp3: bytes, title: str, performer: str, thumbnail: bytes | None, reply_to: int):
-    files = {"audio": ("track.mp3", mp3, "audio/mpeg")}
-    if thumbnail:
-        files["thumbnail"] = ("thumb.png", thumbnail, "image/png")
-    _tg(
+def send_audio(
+    mp3: bytes, title: str, performer: str, thumbnail: bytes | None, reply_to: int,
+    conn: sqlite3.Connection | None = None,
+):
+    extra = {"thumbnail": ("thumb.jpg", thumbnail, "image/jpeg")} if thumbnail else {}
+    _send_file(
+        conn,
         "sendAudio",
+        "audio",
         {
             "chat_id": CHANNEL_ID,
             "title": title,
             "performer": performer,
             "reply_to_message_id": reply_to,
         },
-        files,
+        ("track.mp3", mp3, "audio/mpeg"),
+        extra,
+    )
+
+
+# ---------------------------------------------------------------- observability
+
+
+def _prom_escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _prom_labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_prom_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def render_metrics() -> str:
+    """Prometheus text format (0.0.4) из счётчиков и гистограмм в памяти."""
+    now, mono = time.time(), time.monotonic()
+    with _metrics_lock:
+        counters = dict(_counters)
+        spans = {name: h.summary() for name, h in sorted(_histograms.items())}
+        queued = list(_queue_mirror.values())
+        ticks = sorted(_ticks.items())
+    lines = []
+
+    def metric(name: str, kind: str, help_: str, samples: list[tuple[str, float]]):
+        lines.append(f"# HELP {name} {help_}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{labels} {value!r}" for labels, value in samples)
+
+    for key, help_ in (
+        ("polls", "Successful Roblox polls."),
+        ("poll_errors", "Failed Roblox polls."),
+        ("roblox_429", "Roblox 429 rate-limit responses."),
+        ("tracks_processed", "Tracks taken off the queue and finished."),
+        ("tracks_posted", "Tracks posted to the channel."),
+        ("tracks_bypassed", "Tracks detected as bypassed."),
+        ("tracks_failed", "Track processing failures (requeued)."),
+        ("tracks_dropped", "Tracks dropped after MAX_ATTEMPTS."),
+        ("prescreen_skipped", "Tracks skipped by the pre-screen."),
+    ):
+        metric(f"bot_{key}_total", "counter", help_, [("", counters.get(key, 0))])
+    metric("bot_telegram_upload_bytes_total", "counter", "Bytes uploaded to Telegram.", [("", PUBLISHER.upload_bytes)])
+    metric("bot_queue_depth", "gauge", "Tracks waiting in the queue.", [("", len(queued))])
+    metric(
+        "bot_queue_oldest_age_seconds", "gauge", "Age of the oldest queued track.",
+        [("", max(now - min(queued), 0.0) if queued else 0.0)],
     )
+    metric("bot_uptime_seconds", "gauge", "Seconds since start.", [("", mono - _STARTED)])
+    metric(
+        "bot_last_tick_age_seconds", "gauge", "Seconds since the thread last made progress.",
+        [(_prom_labels(thread=name), mono - t) for name, t in ticks],
+    )
+    metric(
+        "bot_collect_strategy_active", "gauge", "Collection strategy currently ranked best (1).",
+        [(_prom_labels(strategy=name), float(i == _active_strategy)) for i, (name, _) in enumerate(COLLECT_STRATEGIES)],
+    )
+    with _collect_lock:
+        stats = [(name, st.latency, st.errors, st.fresh) for name, st in _strategy_stats.items()]
+    metric(
+        "bot_collect_strategy_latency_seconds", "gauge", "EWMA latency of a collection strategy.",
+        [(_prom_labels(strategy=name), lat) for name, lat, _, _ in stats],
+    )
+    metric(
+        "bot_collect_strategy_failure_ratio", "gauge", "EWMA share of failed or empty responses.",
+        [(_prom_labels(strategy=name), err) for name, _, err, _ in stats],
+    )
+    metric(
+        "bot_collect_strategy_freshness_ratio", "gauge", "EWMA share of responses with the newest id.",
+        # Ещё не опрошенная стратегия свежесть не меряла — без сэмпла, а не None
+        [(_prom_labels(strategy=name), fresh) for name, _, _, fresh in stats if fresh is not None],
+    )
+    samples = []
+    for name, m in spans.items():
+        for q in ("p50", "p95", "p99"):
+            samples.append((_prom_labels(span=name, quantile=f"0.{q[1:]}"), m[q]))
+    metric("bot_span_seconds", "summary", "Latency of instrumented spans.", samples)
+    lines.extend(f"bot_span_seconds_sum{_prom_labels(span=name)} {m['sum']!r}" for name, m in spans.items())
+    lines.extend(f"bot_span_seconds_count{_prom_labels(span=name)} {m['count']}" for name, m in spans.items())
+    return "\n".join(lines) + "\n"
+
+
+def health() -> tuple[bool, dict]:
+    """Живы ли поллер и воркер: шаг был не позже HEALTH_STALL_SECONDS назад.
+    Пока поток ещё не стартовал, ему даётся тот же срок с момента запуска."""
+    with _metrics_lock:
+        ticks = dict(_ticks)
+    mono = time.monotonic()
+    ages = {name: mono - ticks.get(name, _STARTED) for name in ("poller", "worker")}
+    ok = all(age <= HEALTH_STALL_SECONDS for age in ages.values())
+    return ok, {"status": "ok" if ok else "stalled", **{f"{k}_age_seconds": round(v, 1) for k, v in ages.items()}}
+
+
+def start_metrics_server(host: str, port: int):
+    """/metrics и /healthz в фоновом потоке (ThreadingHTTPServer)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def do_GET(self):
+            path = self.path.split("?", 1)[0]
+            if path == "/metrics":
+                code, ctype, body = 200, "text/plain; version=0.0.4", render_metrics()
+            elif path == "/healthz":
+                ok, info = health()
+                code, ctype, body = (200 if ok else 503), "application/json", json.dumps(info)
+            else:
+                code, ctype, body = 404, "text/plain", "not found\n"
+            data = body.encode()
+            self.send_response(code)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics").start()
+    return server
 
 
 # ---------------------------------------------------------------- pipeline
@@ -784,113 +2631,217 @@ def format_db(v: float) -> str:
     return "-inf" if math.isinf(v) else f"{v:.1f}"
 
 
-def is_bypassed(a: dict) -> bool:
-    """Аудио 'пробило' лимиты громкости Roblox: громче -3 LUFS или пик выше +4 dB."""
-    return a["lufs"] > BYPASS_LUFS or a["peak_db"] > BYPASS_PEAK_DB
+def format_stage_times(times: dict) -> str:
+    return ", ".join(f"{name} {sec:.2f}s" for name, sec in times.items())
+
 
+def is_bypassed(a: Analysis) -> bool:
+    """Аудио 'пробило' лимиты громкости Roblox: громче -3 LUFS или пик выше +4 dB.
+    С BYPASS_TRUE_PEAK=1 пик — true-peak (с межсэмпловыми перегрузками)."""
+    peak = a.true_peak_db if BYPASS_TRUE_PEAK else a.peak_db
+    return a.lufs > BYPASS_LUFS or peak > BYPASS_PEAK_DB
 
-def build_caption(item: dict, a: dict) -> str:
-    stereo = "Стерео" if a["is_stereo"] else "Моно"
+
+def build_caption(item: Track, a: Analysis) -> str:
+    stereo = {"mono": "Моно", "fake": "Псевдо-стерео", "stereo": "Стерео"}[a.stereo_kind]
     lines = [
-        f"<b>{escape_html(item['name'])}</b>",
+        f"<b>{escape_html(item.name)}</b>",
         "",
-        f"Длительность: {format_duration(a['duration'])}",
-        f"Громкость: {format_db(a['lufs'])} LUFS / {format_db(a['peak_db'])} dB peak",
-        f"{stereo} · {a['sample_rate']} Hz",
-        f"ID: <a href=\"{asset_url(item['id'])}\">{item['id']}</a>",
-        f"Артист: <a href=\"{artist_url(item['artist'])}\">{escape_html(item['artist'])}</a>",
+        f"Длительность: {format_duration(a.duration)}",
+        f"Громкость: {format_db(a.lufs)} LUFS / {format_db(a.peak_db)} dB peak"
+        f" / {format_db(a.true_peak_db)} dBTP",
+        f"{stereo} · {a.sample_rate} Hz",
+        f"ID: <a href=\"{asset_url(item.id)}\">{item.id}</a>",
+        f"Артист: <a href=\"{artist_url(item.artist)}\">{escape_html(item.artist)}</a>",
     ]
     if is_bypassed(a):
         lines.insert(0, "#bypassed")
     return "\n".join(lines)
 
 
-def process_track(item: dict, conn: sqlite3.Connection | None = None) -> bool:
+def process_track(item: Track, conn: sqlite3.Connection | None = None) -> bool:
     """Обрабатывает трек. Возвращает True, если пост отправлен в канал."""
     t0 = time.time()
-    log.info(">>> processing %s — %s (%s)", item["artist"], item["name"], item["id"])
+    log.info(">>> processing %s — %s (%s)", item.artist, item.name, item.id)
 
     # Сначала только скачиваем и анализируем — этого достаточно, чтобы понять,
     # bypassed трек или нет. Обложку/карточку не трогаем, пока не решили постить.
     t = time.time()
-    ogg = download_audio(item["id"])
+    ogg, cdn_url = None, None
+    if PRESCREEN and ONLY_BYPASSED:
+        # Пре-скрин по кусочкам: заведомо тихие треки не качаем целиком
+        try:
+            ps = prescreen_audio(item.id)
+        except Exception as e:
+            log.warning("    [1/5] pre-screen failed (%s) — full download", e)
+        else:
+            ogg, cdn_url = ps.ogg, ps.url
+            if ps.estimate is not None:
+                est = ps.estimate
+                log.info(
+                    "    [1/5] pre-screen: %.0f of %.0f KB in %.1fs, ~%.1f LUFS, ~%.1f dB peak -> %s",
+                    ps.fetched / 1024, ps.size / 1024, time.time() - t, est.lufs, est.peak_db,
+                    "skip" if ps.verdict == "skip" else "full analysis",
+                )
+            if ps.verdict == "skip":
+                count("prescreen_skipped")
+                if conn is not None:
+                    # оценка по окнам — чтобы трек не выпал из бэктеста порогов
+                    save_profile(conn, item.id, ps.estimate, prescreened=True)
+                log.info("<<< skipped %s (pre-screen: not bypassed), took %.1fs total", item.id, time.time() - t0)
+                return False
+    if ogg is None:
+        ogg = download_audio(item.id, cdn_url)
     log.info("    [1/5] audio downloaded: %.1f KB in %.1fs", len(ogg) / 1024, time.time() - t)
 
+    # Этапы, не нужные для вердикта (mp3, стерео), при ONLY_BYPASSED
+    # откладываются и считаются вторым проходом только для постящихся треков.
+    first, deferred = analysis_plan()
     t = time.time()
-    analysis = analyze_and_encode(ogg)
+    analysis = analyze_and_encode(ogg, first)
     log.info(
-        "    [2/5] analyzed in %.1fs: %.1fs long, %d Hz, %s, %.1f LUFS, %.1f dB peak, mp3 %.1f KB",
-        time.time() - t, analysis["duration"], analysis["sample_rate"],
-        "stereo" if analysis["is_stereo"] else "mono",
-        analysis["lufs"], analysis["peak_db"], len(analysis["mp3"]) / 1024,
+        "    [2/5] analyzed in %.1fs: %.1fs long, %d Hz, %.1f LUFS, %.1f dB peak, %s dBTP (%s)",
+        time.time() - t, analysis.duration, analysis.sample_rate, analysis.lufs,
+        analysis.peak_db, format_db(analysis.true_peak_db) if analysis.true_peak_db is not None else "n/a",
+        format_stage_times(analysis.stage_times),
     )
 
+    if conn is not None:
+        save_profile(conn, item.id, analysis)
+
     bypassed = is_bypassed(analysis)
     log.info(
         "    [3/5] bypass check: %s (thresholds: >%.1f LUFS or >%.1f dB)",
         "BYPASSED!" if bypassed else "not bypassed", BYPASS_LUFS, BYPASS_PEAK_DB,
     )
 
+    if bypassed:
+        count("tracks_bypassed")
     if bypassed and conn is not None:
-        record_bypassed_artist(conn, item["artist"])
+        record_bypassed_artist(conn, item.artist)
 
     if ONLY_BYPASSED and not bypassed:
-        log.info("<<< skipped %s (not bypassed), took %.1fs total", item["id"], time.time() - t0)
+        log.info("<<< skipped %s (not bypassed), took %.1fs total", item.id, time.time() - t0)
         return False
 
+    if deferred:
+        t = time.time()
+        extra = analyze_and_encode(ogg, deferred)
+        analysis.merge(extra)
+        log.info(
+            "    [2/5] deferred %s in %.1fs: %s (side/mid %s dB), mp3 %.1f KB (%s)",
+            "+".join(deferred), time.time() - t, analysis.stereo_kind,
+            format_db(analysis.side_mid_db), len(analysis.mp3) / 1024, format_stage_times(extra.stage_times),
+        )
+
     t = time.time()
-    cover = fetch_thumbnail(item["id"])
-    card = render_card(item["name"], item["artist"], cover, analysis["waveform"])
+    cover = fetch_thumbnail(item.id)
+    card = render_card(item.name, item.artist, cover, analysis.waveform)
+    thumb = make_thumbnail(cover)
     log.info(
-        "    [4/5] card rendered in %.1fs (cover: %s)",
-        time.time() - t, f"{len(cover) / 1024:.0f} KB" if cover else "none, fallback used",
+        "    [4/5] card rendered in %.1fs (%s %.0f KB, cover: %s)",
+        time.time() - t, CARD_FORMAT, len(card) / 1024,
+        f"{len(cover) / 1024:.0f} KB" if cover else "none, fallback used",
     )
 
     t = time.time()
+    up_bytes, up_seconds = PUBLISHER.upload_bytes, PUBLISHER.upload_seconds
     caption = build_caption(item, analysis)
-    photo_message_id = send_photo(card, caption)
-    send_audio(analysis["mp3"], item["name"], item["artist"], cover, photo_message_id)
-    log.info("    [5/5] sent to telegram in %.1fs (photo msg id: %d)", time.time() - t, photo_message_id)
+    photo_message_id = send_photo(card, caption, conn)
+    send_audio(analysis.mp3, item.name, item.artist, thumb, photo_message_id, conn)
+    log.info(
+        "    [5/5] sent to telegram in %.1fs (uploaded %.0f KB in %.1fs, photo msg id: %d)",
+        time.time() - t, (PUBLISHER.upload_bytes - up_bytes) / 1024,
+        PUBLISHER.upload_seconds - up_seconds, photo_message_id,
+    )
 
     log.info(
         "<<< POSTED %s%s, took %.1fs total",
-        item["id"], " [bypassed]" if bypassed else "", time.time() - t0,
+        item.id, " [bypassed]" if bypassed else "", time.time() - t0,
     )
     return True
 
 
-def poll_once(conn: sqlite3.Connection):
-    """Быстрая проверка: находит новые треки и ставит их в очередь (FIFO)."""
-    ids = fetch_latest_ids(50)
+class CreatorScheduler:
+    """Общий планировщик опроса создателей. За один поллинг опрашивается
+    один создатель, поэтому бюджет запросов к Roblox и память не растут с
+    длиной WATCH_CREATORS. Кого опросить — решает stride scheduling: у
+    каждого создателя есть «проход», выбирается наименьший, после опроса он
+    растёт на 1/вес. Вес — частота загрузок создателя (экспоненциально
+    затухающая, окно RATE_WINDOW) плюс BASE_RATE, чтобы тихие аккаунты
+    тоже проверялись, только реже."""
+
+    RATE_WINDOW = 3600.0
+    BASE_RATE = 1 / 3600  # пол: как будто один трек в час
+
+    def __init__(self, creators: list[int], rates: dict[int, float] | None = None):
+        rates = rates or {}
+        self.rate = {c: rates.get(c, 0.0) for c in creators}
+        self.passes = {c: 0.0 for c in creators}
+        self.last_poll: dict[int, float] = {}
+
+    def next(self) -> int:
+        creator = min(self.passes, key=self.passes.get)
+        self.passes[creator] += 1.0 / (self.rate[creator] + self.BASE_RATE)
+        return creator
+
+    def observe(self, creator: int, uploads: int, now: float | None = None):
+        """Учёт опроса: uploads — сколько новых треков нашлось."""
+        now = time.monotonic() if now is None else now
+        last = self.last_poll.get(creator)
+        self.last_poll[creator] = now
+        if last is not None:
+            decay = math.exp(-(now - last) / self.RATE_WINDOW)
+            self.rate[creator] = self.rate[creator] * decay + uploads / self.RATE_WINDOW
+
+    def format(self) -> str:
+        top = sorted(self.rate.items(), key=lambda kv: -kv[1])[:5]
+        more = f" (+{len(self.rate) - len(top)} more)" if len(self.rate) > len(top) else ""
+        return ", ".join(f"{c} {r * 3600:.1f}/h" for c, r in top) + more
+
+
+def poll_once(conn: sqlite3.Connection, scheduler: CreatorScheduler):
+    """Быстрая проверка одного создателя (его выбирает планировщик): находит
+    новые треки и ставит их в общую очередь."""
+    creator = scheduler.next()
+    ids = fetch_latest_ids(creator, 50)
     if not ids:
-        log.warning("poll: Roblox returned 0 ids (all strategies)")
+        scheduler.observe(creator, 0)
+        log.warning("poll: Roblox returned 0 ids for creator %s (all strategies)", creator)
         return
 
-    first_run = is_first_run(conn)
+    first_run = not creator_seeded(conn, creator)
     new_ids = [i for i in ids if not already_posted(conn, i) and not in_queue(conn, i)]
+    # Засев — не загрузки: весь каталог нового создателя не должен задрать его вес
+    scheduler.observe(creator, 0 if first_run else len(new_ids))
     if not new_ids:
-        log.debug("poll: %d ids, no new", len(ids))
+        if first_run:
+            mark_creator_seeded(conn, creator)
+        log.debug("poll: creator %s: %d ids, no new", creator, len(ids))
         return
 
-    log.info("poll: %d ids from Roblox, %d NEW", len(ids), len(new_ids))
-    details = {d["id"]: d for d in fetch_details(new_ids)}
+    log.info("poll: creator %s: %d ids from Roblox, %d NEW", creator, len(ids), len(new_ids))
+    details = {d.id: d for d in fetch_details(new_ids)}
 
     if first_run:
-        # Первый запуск: только запоминаем текущие треки, без спама в канал
-        log.info("first run — seeding %d assets without posting", len(new_ids))
+        # Первый опрос создателя: только запоминаем текущие треки, без спама в канал
+        log.info("first poll of creator %s — seeding %d assets without posting", creator, len(new_ids))
         for i in new_ids:
-            d = details.get(i, {})
-            mark_posted(conn, i, d.get("name", ""), d.get("artist", ""), d.get("created_utc", ""), seeded=True)
+            mark_posted(conn, details.get(i) or Track(i, "", "", ""), seeded=True)
+        mark_creator_seeded(conn, creator)
         return
 
     # В очередь от старых к новым — постятся в хронологическом порядке
     for i in reversed(new_ids):
         d = details.get(i)
         if not d:
-            mark_posted(conn, i, "", "", "", seeded=False)
+            mark_posted(conn, Track(i, "", "", ""), seeded=False)
             continue
-        enqueue(conn, d)
-        log.info("queued %s — %s (%s), queue size: %d", d["artist"], d["name"], i, queue_size(conn))
+        priority = enqueue(conn, d)
+        log.info(
+            "queued %s — %s (%s), priority %.0f, queue size: %d",
+            d.artist, d.name, i, priority, queue_size(conn),
+        )
 
 
 def poller_loop():
@@ -902,16 +2853,24 @@ def poller_loop():
     из ответа сервера и продолжаем — так бот никогда не попадёт в бан,
     сохраняя максимально возможную частоту проверок."""
     conn = db_connect()  # своё соединение для этого потока
+    scheduler = CreatorScheduler([int(c) for c in WATCH_CREATORS], load_creator_rates(conn))
     polls = 0
     last_heartbeat = time.time()
+    first_poll = True
     while True:
         delay = CHECK_INTERVAL
         try:
-            poll_once(conn)
+            poll_once(conn, scheduler)
             polls += 1
+            count("polls")
+            if first_poll:
+                log.info("first poll done %.0f ms after start", (time.monotonic() - _STARTED) * 1000)
+                first_poll = False
         except requests.HTTPError as e:
+            count("poll_errors")
             status = e.response.status_code if e.response is not None else 0
             if status == 429:
+                count("roblox_429")
                 retry_after = (e.response.headers.get("Retry-After") or "").strip()
                 delay = float(retry_after) if retry_after.replace(".", "", 1).isdigit() else 5.0
                 delay = min(max(delay, 1.0), 60.0)
@@ -920,8 +2879,10 @@ def poller_loop():
                 log.warning("poll failed with HTTP %s — waiting 3s", status)
                 delay = max(delay, 3.0)
         except Exception:
+            count("poll_errors")
             log.exception("poll failed — waiting 3s")
             delay = max(delay, 3.0)
+        tick("poller")
 
         # Heartbeat: регулярно показываем, что бот жив, и общую статистику
         now = time.time()
@@ -937,6 +2898,17 @@ def poller_loop():
                 polls, int(now - last_heartbeat), rate,
                 queue_size(conn), posted_total, artists_total,
             )
+            log.info("[heartbeat] strategies: %s", format_strategy_stats())
+            log.info("[heartbeat] creators: %s", scheduler.format())
+            save_creator_rates(conn, scheduler.rate)
+            snapshot, interval = metrics_snapshot(), interval_snapshot()
+            if interval:
+                log.info("[heartbeat] latency (last %ds): %s", int(now - last_heartbeat), format_spans(interval))
+            if METRICS_JSON:
+                try:
+                    dump_metrics_json(METRICS_JSON, snapshot, interval)
+                except OSError as e:
+                    log.warning("metrics json dump failed: %s", e)
             polls = 0
             last_heartbeat = now
 
@@ -945,19 +2917,21 @@ def poller_loop():
 
 
 def worker_loop():
-    """Основной поток: разбирает очередь по одному треку (FIFO)."""
+    """Основной поток: разбирает очередь по одному треку (см. QUEUE_MODE)."""
     conn = db_connect()
     while True:
+        tick("worker")
         item = queue_next(conn)
         if item is None:
             time.sleep(1)
             continue
 
-        i = item["id"]
+        i = item.id
         # Слишком много неудач (в т.ч. жёстких крашей) — пропускаем навсегда
         if get_attempts(conn, i) >= MAX_ATTEMPTS:
             log.warning("skipping %s after %d failed attempts", i, MAX_ATTEMPTS)
-            mark_posted(conn, i, item["name"], item["artist"], item["created_utc"], seeded=False)
+            count("tracks_dropped")
+            mark_posted(conn, item, seeded=False)
             dequeue(conn, i)
             continue
 
@@ -967,6 +2941,7 @@ def worker_loop():
         try:
             posted = process_track(item, conn)
         except Exception:
+            count("tracks_failed")
             log.exception(
                 "failed to process %s — retry later (attempt %d/%d)",
                 i, get_attempts(conn, i), MAX_ATTEMPTS,
@@ -975,45 +2950,138 @@ def worker_loop():
             time.sleep(3)
             continue
 
-        mark_posted(conn, i, item["name"], item["artist"], item["created_utc"], seeded=False)
+        mark_posted(conn, item, seeded=False)
         dequeue(conn, i)
+        count("tracks_processed")
         if posted:
-            time.sleep(3)  # не упираемся в rate limit телеграма (только после реального поста)
+            count("tracks_posted")
+        # Паузы между постами не нужны: темп держит PUBLISHER (token bucket + retry_after)
+
+
+def warm_up():
+    """Фоновый прогрев при FAST_START: импорт тяжёлых модулей и докачка
+    шрифтов, пока поллер уже работает. Воркер, которому модуль понадобится
+    раньше, просто импортирует его сам."""
+    t = time.monotonic()
+    try:
+        for mod in list(globals().values()):
+            if isinstance(mod, _LazyModule):
+                mod.load()
+        try:
+            ensure_fonts()
+        except Exception as e:
+            log.warning("fonts download failed: %s — cards will use the default font", e)
+    finally:
+        _fonts_ready.set()
+    log.info("warm-up done in %.1fs", time.monotonic() - t)
+
+
+def self_check():
+    """Самодиагностика: сразу видно, отдаёт ли Roblox данные с этого IP/хостинга."""
+    log.info("self-check: querying Roblox API...")
+    try:
+        ids = fetch_latest_ids(int(WATCH_CREATORS[0]), 5)
+        log.info("self-check: got %d ids: %s", len(ids), ids)
+        for d in fetch_details(ids[:3]):
+            log.info("self-check: fresh track: %s — %s (%s), created %s",
+                     d.artist, d.name, d.id, d.created_utc)
+        log.info("self-check: OK — collection is working")
+    except Exception:
+        log.exception("self-check FAILED — Roblox is not reachable from this host. "
+                      "Check network / firewall / IP block")
 
 
 def main():
+    # python bot.py backtest <LUFS> <PEAK_DB> — прогон новых порогов по сохранённым профилям
+    if sys.argv[1:2] == ["backtest"]:
+        if len(sys.argv) != 4:
+            print("Использование: python bot.py backtest <LUFS> <PEAK_DB>")
+            sys.exit(1)
+        backtest(db_connect(), float(sys.argv[2]), float(sys.argv[3]))
+        return
+
     if not BOT_TOKEN or not CHANNEL_ID:
         print("Ошибка: задай переменные окружения TELEGRAM_BOT_TOKEN и TELEGRAM_CHANNEL_ID")
         sys.exit(1)
+    if CARD_FORMAT not in CARD_FILES:
+        print(f"Ошибка: CARD_FORMAT должен быть одним из: {', '.join(CARD_FILES)}")
+        sys.exit(1)
+    if not WATCH_CREATORS or not all(c.isdigit() for c in WATCH_CREATORS):
+        print("Ошибка: WATCH_CREATORS должен быть списком числовых ID через запятую")
+        sys.exit(1)
+    if PRESCREEN and PRESCREEN_WINDOWS < 2:
+        print("Ошибка: PRESCREEN_WINDOWS должен быть не меньше 2")
+        sys.exit(1)
+    if PRESCREEN and PRESCREEN_MIN_BURST <= 0.5:
+        print("Ошибка: PRESCREEN_MIN_BURST должен быть больше 0.5 сек")
+        sys.exit(1)
+    if QUEUE_MODE not in ("fifo", "priority"):
+        print("Ошибка: QUEUE_MODE должен быть fifo или priority")
+        sys.exit(1)
+    if HEDGE_MODE not in ("hedge", "all", "off"):
+        print("Ошибка: HEDGE_MODE должен быть hedge, all или off")
+        sys.exit(1)
+    if PROFILER not in ("", "collapsed", "pstats"):
+        print("Ошибка: PROFILER должен быть collapsed или pstats")
+        sys.exit(1)
+    unknown = [n for n in ANALYSIS_STAGES if n not in ANALYZER_STAGES]
+    if unknown:
+        print(f"Ошибка: неизвестные этапы в ANALYSIS_STAGES: {', '.join(unknown)} "
+              f"(доступны: {', '.join(ANALYZER_STAGES)})")
+        sys.exit(1)
 
-    ensure_fonts()
     conn = db_connect()  # создаём таблицы до старта потоков
     rewrite_artists_txt(conn)  # txt существует с первого запуска, даже пустой
+    load_queue_mirror(conn)
+    if METRICS_PORT:
+        start_metrics_server(METRICS_HOST, METRICS_PORT)
+    if FAST_START:
+        # Поллер — первым делом: после рестарта каждая секунда без поллинга —
+        # шанс пропустить свежую заливку. Всё остальное догружается в фоне.
+        threading.Thread(target=poller_loop, daemon=True, name="poller").start()
     log.info("=" * 60)
     log.info("DistroKid -> Roblox -> Telegram bot starting")
     log.info("  polling:   %s", "continuous (no delay)" if CHECK_INTERVAL <= 0 else f"every {CHECK_INTERVAL:g}s")
     log.info("  posting:   %s", "ONLY bypassed tracks" if ONLY_BYPASSED else "all tracks")
-    log.info("  bypass at: >%s LUFS or >%s dB peak", BYPASS_LUFS, BYPASS_PEAK_DB)
+    first, deferred = analysis_plan()
+    log.info("  analysis:  %s (deferred: %s)", ",".join(first), ",".join(deferred) or "none")
+    log.info(
+        "  bypass at: >%s LUFS or >%s %s", BYPASS_LUFS, BYPASS_PEAK_DB,
+        "dBTP (true peak)" if BYPASS_TRUE_PEAK else "dB peak",
+    )
     log.info("  channel:   %s", CHANNEL_ID)
     log.info("  database:  %s", DB_PATH)
     log.info("  artists:   %s", ARTISTS_TXT)
     log.info("  heartbeat: every %ds", HEARTBEAT_SECONDS)
+    log.info("  collect:   %s over %d strategies", HEDGE_MODE, len(COLLECT_STRATEGIES))
+    log.info("  creators:  %s", ", ".join(WATCH_CREATORS))
+    if PRESCREEN:
+        log.info(
+            "  prescreen: >=%d x %d KB windows, gaps <%.1fs, margin %.1f%s",
+            PRESCREEN_WINDOWS, PRESCREEN_WINDOW_KB, PRESCREEN_MIN_BURST - 0.5, PRESCREEN_MARGIN, "" if ONLY_BYPASSED else " (off: ONLY_BYPASSED=0)",
+        )
+    log.info("  queue:     %s", QUEUE_MODE if QUEUE_MODE == "fifo" else f"priority, aging {QUEUE_AGING:g}/min")
+    if METRICS_PORT:
+        log.info(
+            "  metrics:   http://%s:%d/metrics, /healthz (stall after %gs)",
+            METRICS_HOST, METRICS_PORT, HEALTH_STALL_SECONDS,
+        )
+    log.info("  startup:   %s", "fast (warm-up and self-check in background)" if FAST_START else "sequential")
+    if PROFILER:
+        log.info("  profiler:  %s every %gms -> %s", PROFILER, PROFILE_INTERVAL * 1000, PROFILE_OUT)
     log.info("=" * 60)
 
-    # Самодиагностика: сразу видно, отдаёт ли Roblox данные с этого IP/хостинга
-    log.info("self-check: querying Roblox API...")
-    try:
-        ids = fetch_latest_ids(5)
-        log.info("self-check: got %d ids: %s", len(ids), ids)
-        for d in fetch_details(ids[:3]):
-            log.info("self-check: fresh track: %s — %s (%s), created %s",
-                     d["artist"], d["name"], d["id"], d["created_utc"])
-        log.info("self-check: OK — collection is working")
-    except Exception:
-        log.exception("self-check FAILED — Roblox is not reachable from this host. "
-                      "Check network / firewall / IP block")
+    if PROFILER:
+        SamplingProfiler(PROFILER, PROFILE_OUT, PROFILE_INTERVAL).start()
 
-    threading.Thread(target=poller_loop, daemon=True, name="poller").start()
+    if FAST_START:
+        _fonts_ready.clear()  # до старта воркера: первая карточка дождётся шрифтов
+        threading.Thread(target=warm_up, daemon=True, name="warm-up").start()
+        threading.Thread(target=self_check, daemon=True, name="self-check").start()
+    else:
+        ensure_fonts()
+        self_check()
+        threading.Thread(target=poller_loop, daemon=True, name="poller").start()
     worker_loop()
 
 